@@ -0,0 +1,74 @@
+"""
+Regression check for healthier_alternatives_bulk (sparse table + binary-lifting search).
+
+    python -m benchmarks.check_swaps [--rows 20000]
+
+Every row's bulk swap is compared with the per-row SwapIndex.lookup_position, which is
+the reference rule (same ordering and (category, prep) -> category -> menu fallback).
+Cases: the bundled menu (default and compact), a synthetic menu, a synthetic menu with
+NaN prep / sugar, and menus tiled many times so the same beverage forms long runs of
+identical keys (the case the next-different-beverage jump exists for).
+Exit code 1 on any mismatch.
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_menu
+from src.utils import (SwapIndex, add_features, compact_frame, find_data_file, healthier_alternatives_bulk,
+                       load_menu, normalize_columns)
+
+def reference_swaps(df: pd.DataFrame, by=("category", "prep"), sort_by=("calories", "sugar_g")) -> pd.Series:
+    """swap_row per row from one SwapIndex.lookup_position call each (NA if no swap)."""
+    index = SwapIndex(df, by=by, sort_by=sort_by)
+    out = []
+    for _, row in df.iterrows():
+        pos = index.lookup_position(row)
+        out.append(pd.NA if pos is None else df.index[pos])
+    return pd.Series(out, index=df.index, dtype="Int64")
+
+def check(name: str, df: pd.DataFrame, by=("category", "prep")) -> int:
+    """Number of rows where the bulk swap differs from the reference."""
+    bulk = healthier_alternatives_bulk(df, by=list(by))["swap_row"].astype("Int64")
+    ref = reference_swaps(df, by=by)
+    diff = ~((bulk == ref).fillna(False) | (bulk.isna() & ref.isna()))
+    n_bad = int(diff.sum())
+    print(f"{'OK  ' if not n_bad else 'FAIL'} {name:<40} {len(df):>7,} rows  {int(ref.notna().sum()):>7,} swaps  "
+          f"{n_bad} mismatches", file=sys.stderr)
+    return n_bad
+
+def cases(n_rows: int, seed: int = 0):
+    menu = load_menu(find_data_file())
+    yield "bundled menu", menu, ("category", "prep")
+    yield "bundled menu, by category", menu, ("category",)
+    yield "bundled menu, compact", compact_frame(menu), ("category", "prep")
+
+    synth = add_features(normalize_columns(synthetic_menu(n_rows, seed=seed)))
+    yield "synthetic", synth, ("category", "prep")
+
+    rng = np.random.default_rng(seed)
+    holes = synth.copy()
+    holes.loc[holes.index[rng.random(len(holes)) < 0.05], "prep"] = np.nan
+    holes.loc[holes.index[rng.random(len(holes)) < 0.05], "sugar_g"] = np.nan
+    yield "synthetic, NaN prep/sugar", holes, ("category", "prep")
+
+    # Cùng tên đồ uống lặp lại thành dải dài với khóa giống hệt nhau
+    tiled = pd.concat([menu] * 50, ignore_index=True)
+    yield "bundled menu tiled x50", tiled, ("category", "prep")
+    yield "single-beverage category tiled x200", pd.concat([menu[menu["beverage"] == menu["beverage"].iloc[0]]] * 200,
+                                                             ignore_index=True), ("category",)
+    espresso = menu[menu["category"] == "Classic Espresso Drinks"]
+    yield "espresso drinks tiled x200, by category", pd.concat([espresso] * 200, ignore_index=True), ("category",)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare healthier_alternatives_bulk with per-row SwapIndex lookups.")
+    parser.add_argument("--rows", type=int, default=20_000, help="Synthetic menu size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    bad = sum(check(name, df, by) for name, df, by in cases(args.rows, args.seed))
+    return 1 if bad else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
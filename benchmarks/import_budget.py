@@ -0,0 +1,107 @@
+"""
+Import-time budget for the app entry points (cold start of a fresh replica).
+
+    python -m benchmarks.import_budget [--json out.json] [--repeat 3]
+
+For each page the top-level import statements are extracted with ast and run in a
+fresh interpreter under `python -X importtime`. Two things are checked:
+  - the cumulative import time of the project's own modules (src.*, including
+    whatever they pull in that the page has not already imported), best of --repeat
+    runs, against SRC_IMPORT_BUDGET_MS; streamlit/pandas dominate the wall clock and
+    are not ours to budget, so they are only reported;
+  - none of the LAZY_MODULES (loaded on first use only) appears in the import log.
+Exit code 1 if any entry point fails either check.
+"""
+import argparse
+import ast
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+ENTRIES = ["streamlit_app.py", "pages/1_EDA.py", "pages/2_Compare.py", "pages/3_Recommender.py", "pages/4_Models.py"]
+
+# src.* đo được ~5 ms trên máy dev; ngưỡng rộng để không phụ thuộc máy/CI
+SRC_IMPORT_BUDGET_MS = 60
+# Chỉ được import khi dùng lần đầu (lazy_import / import trong hàm)
+LAZY_MODULES = ("sklearn", "reportlab", "matplotlib", "seaborn")
+PROJECT_PACKAGE = "src"
+
+def entry_imports(path: Path) -> str:
+    """Top-level import statements of a script, as runnable source."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    nodes = [n for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(n) for n in nodes)
+
+def parse_importtime(stderr: str) -> list:
+    """[(module, depth, cumulative µs)] from `-X importtime` output, in log order (children first)."""
+    out = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        stripped = name.lstrip()
+        out.append((stripped.strip(), (len(name) - len(stripped)) // 2, int(cumulative)))
+    return out
+
+def _top_package(module: str) -> str:
+    return module.split(".")[0]
+
+def project_time(modules: list) -> int:
+    """Cumulative µs of the outermost src.* imports (nested src modules are not counted twice)."""
+    total, ancestors = 0, []
+    # Đi ngược log: module cha đứng trước các module con của nó
+    for name, depth, cumulative in reversed(modules):
+        while ancestors and ancestors[-1][1] >= depth:
+            ancestors.pop()
+        if _top_package(name) == PROJECT_PACKAGE and not any(_top_package(a) == PROJECT_PACKAGE for a, _ in ancestors):
+            total += cumulative
+        ancestors.append((name, depth))
+    return total
+
+def measure(entry: str, repeat: int = 3) -> dict:
+    code = entry_imports(ROOT / entry)
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                              cwd=ROOT, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{entry}: import failed\n{proc.stderr[-2000:]}")
+        modules = parse_importtime(proc.stderr)
+        own = project_time(modules)
+        if best is None or own < best[0]:
+            best = (own, modules)
+    own, modules = best
+    top_level = {name: us for name, depth, us in modules if depth == 0}
+    eager = sorted({_top_package(name) for name, _, _ in modules} & set(LAZY_MODULES))
+    top = sorted(top_level.items(), key=lambda kv: -kv[1])[:5]
+    return {
+        "entry": entry,
+        "src_ms": round(own / 1000, 1),
+        "budget_ms": SRC_IMPORT_BUDGET_MS,
+        "total_ms": round(sum(top_level.values()) / 1000, 1),
+        "eager_lazy_modules": eager,
+        "ok": own / 1000 <= SRC_IMPORT_BUDGET_MS and not eager,
+        "heaviest": {name: round(us / 1000, 1) for name, us in top},
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure page import time against the budget.")
+    parser.add_argument("entries", nargs="*", default=ENTRIES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", default=None, help="Write results to this file")
+    args = parser.parse_args(argv)
+
+    results = [measure(entry, args.repeat) for entry in args.entries]
+    for r in results:
+        flag = "OK  " if r["ok"] else "OVER"
+        eager = f"  EAGER: {', '.join(r['eager_lazy_modules'])}" if r["eager_lazy_modules"] else ""
+        print(f"{flag} {r['entry']:<24} src {r['src_ms']:>6.1f} ms / {r['budget_ms']} ms  (total {r['total_ms']:.0f} ms: "
+              + ", ".join(f"{k} {v}" for k, v in r["heaviest"].items()) + ")" + eager)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return 0 if all(r["ok"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
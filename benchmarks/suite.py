@@ -0,0 +1,208 @@
+"""
+Scale benchmarks for the core data path, on synthetic menus of 10k / 1M / 10M rows.
+
+    python -m benchmarks.suite --sizes 10k,1M --json bench.json
+    python -m benchmarks.suite --sizes 10k --compare bench.json     # exit 1 on regression
+
+Each benchmark is a `time_*` function (asv style) that receives the shared context
+for one size. Setup work is done once per size and excluded from the timings.
+Model fits run on a sample of at most --model-rows rows, because KMeans/KNN on 10M
+rows would take far longer than the rest of the suite. They time the paths the
+Models page ships (cluster_sweep, knn_cv_search, fit_knn).
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import parse_size, write_synthetic_csv
+from src.models import ModelRegistry, cluster_sweep, fit_knn, knn_cv_search
+from src.utils import (NutrientRangeIndex, SwapIndex, add_features, compact_frame, footprint_report,
+                       get_clean_data_for_ml, goal_filter, healthier_alternative, load_data, normalize_columns,
+                       stream_nutrient_cube, top_k)
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# --- 1. Benchmarks ---
+def time_load_data_csv(ctx):
+    load_data(ctx["csv"], use_cache=False)
+
+def time_load_data_cached(ctx):
+    load_data(ctx["csv"])
+
+def time_stream_nutrient_cube(ctx):
+    stream_nutrient_cube(ctx["csv"])
+
+def time_normalize_columns(ctx):
+    normalize_columns(ctx["raw"])
+
+def time_add_features(ctx):
+    # Feature engineering của 1_EDA (health_tier, efficiency_index, nutrient_score, full_name)
+    add_features(ctx["data"])
+
+def time_compact_frame(ctx):
+    compact_frame(ctx["menu"])
+
+def time_goal_filter_scan(ctx):
+    goal_filter(ctx["menu"], 150, 20, 10)
+
+def time_goal_filter_index(ctx):
+    goal_filter(ctx["menu"], 150, 20, 10, index=ctx["range_index"])
+
+def time_healthier_alternative_scan(ctx):
+    # Không truyền index -> một lượt quét có mask trên toàn bảng
+    for row in ctx["rows"]:
+        healthier_alternative(ctx["menu"], row)
+
+def time_healthier_alternative_index(ctx):
+    for row in ctx["rows"]:
+        healthier_alternative(ctx["menu"], row, index=ctx["swap_index"])
+
+def time_top_k(ctx):
+    top_k(ctx["menu"], "calories", 10)
+
+def time_get_clean_data_for_ml(ctx):
+    get_clean_data_for_ml(ctx["menu"])
+
+def time_cluster_sweep(ctx):
+    # Giống trang 4_Models: fit mọi k (2..6) song song
+    cluster_sweep(ctx["sample"], ks=range(2, 7), registry=ctx["new_registry"]())
+
+def time_knn_cv_search(ctx):
+    knn_cv_search(ctx["sample"], registry=ctx["new_registry"]())
+
+def time_fit_knn(ctx):
+    fit_knn(ctx["sample"], n_neighbors=5, registry=ctx["new_registry"]())
+
+BENCHMARKS = {name[len("time_"):]: fn for name, fn in globals().items() if name.startswith("time_")}
+# Chạy trên ctx["sample"] thay vì toàn bộ menu
+MODEL_BENCHMARKS = {"cluster_sweep", "knn_cv_search", "fit_knn"}
+
+# --- 2. Context / runner ---
+def make_context(n_rows: int, workdir: Path, model_rows: int, seed: int = 0) -> dict:
+    """Generate the CSV and every prebuilt input the benchmarks need for one size."""
+    csv = write_synthetic_csv(workdir / f"menu_{n_rows}.csv", n_rows, seed=seed)
+    raw = pd.read_csv(csv)
+    data = normalize_columns(raw)
+    menu = add_features(data)
+    load_data(str(csv))  # ghi sẵn snapshot Parquet cho time_load_data_cached
+    rng = np.random.default_rng(seed)
+    sample = menu.iloc[np.sort(rng.choice(len(menu), min(model_rows, len(menu)), replace=False))]
+    sample = sample.reset_index(drop=True)
+    counter = iter(range(1 << 30))
+    return {
+        "csv": str(csv),
+        "raw": raw,
+        "data": data,
+        "menu": menu,
+        "range_index": NutrientRangeIndex(menu),
+        "swap_index": SwapIndex(menu),
+        "rows": [menu.iloc[int(p)] for p in rng.integers(0, len(menu), 20)],
+        "sample": sample,
+        # Registry mới cho mỗi lần đo để không bao giờ trúng cache model
+        "new_registry": lambda: ModelRegistry(workdir / "models" / str(next(counter))),
+    }
+
+def run_benchmark(fn, ctx, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(ctx)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+def run_suite(sizes, names=None, repeat: int = 3, model_rows: int = 100_000) -> dict:
+    names = names or list(BENCHMARKS)
+    results, memory = [], []
+    with tempfile.TemporaryDirectory(prefix="menu-bench-") as tmp:
+        for n_rows in sizes:
+            ctx = make_context(n_rows, Path(tmp), model_rows)
+            total = footprint_report(ctx["menu"], compact_frame(ctx["menu"])).loc["TOTAL"]
+            memory.append({"size": n_rows, "bytes_default": int(total["bytes_before"]),
+                           "bytes_compact": int(total["bytes_after"]), "ratio": float(total["ratio"])})
+            for name in names:
+                samples = run_benchmark(BENCHMARKS[name], ctx, repeat)
+                rows = len(ctx["sample"]) if name in MODEL_BENCHMARKS else n_rows
+                results.append({
+                    "name": name, "rows": rows, "size": n_rows, "repeat": repeat,
+                    "min_s": min(samples), "median_s": statistics.median(samples),
+                    "mean_s": statistics.fmean(samples), "samples_s": samples,
+                })
+                print(f"{name:<32} {n_rows:>10,} rows  median {results[-1]['median_s'] * 1000:>10.2f} ms", file=sys.stderr)
+            del ctx
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "model_rows": model_rows,
+        },
+        "results": results,
+        "memory": memory,
+    }
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Benchmarks whose median got slower than baseline * (1 + tolerance)."""
+    base = {(r["name"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        old = base.get((r["name"], r["size"]))
+        if old and r["median_s"] > old["median_s"] * (1 + tolerance):
+            regressions.append({"name": r["name"], "size": r["size"], "baseline_s": old["median_s"],
+                                "current_s": r["median_s"], "ratio": r["median_s"] / old["median_s"]})
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the scale benchmarks on synthetic menus.")
+    parser.add_argument("--sizes", default="10k,1M", help="Comma-separated row counts, e.g. 10k,1M,10M")
+    parser.add_argument("--bench", default=None, help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--model-rows", type=int, default=100_000)
+    parser.add_argument("--json", default=None, help="Write results to this file")
+    parser.add_argument("--compare", default=None, help="Baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs. baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    names = args.bench.split(",") if args.bench else None
+    unknown = set(names or []) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    report = run_suite(sizes, names, repeat=args.repeat, model_rows=args.model_rows)
+
+    status = 0
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        report["regressions"] = compare(report, baseline, args.tolerance)
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['name']} @ {r['size']:,} rows: {r['baseline_s']:.4f}s -> {r['current_s']:.4f}s "
+                  f"(x{r['ratio']:.2f})", file=sys.stderr)
+        status = 1 if report["regressions"] else 0
+    text = json.dumps(report, indent=2)
+    if args.json:
+        Path(args.json).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Synthetic menus in the raw Starbucks CSV schema, grown from the bundled 242 rows.
+
+Rows are resampled from the real menu, so the joint category / beverage / prep
+distribution matches the source. Nutrients get a small multiplicative jitter,
+and beverages get a regional suffix ("Caffè Latte R12") so that name cardinality
+grows with the menu. Raw quirks are kept: "%" DV strings, "Varies" caffeine and
+the odd "3 2" fat value.
+
+    python -m benchmarks.synthetic out.csv 1M
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.utils import find_data_file
+
+# Cột số trong CSV gốc -> số chữ số thập phân khi ghi lại
+NUMERIC_RAW = {
+    "Calories": 0, "Total.Fat..g.": 1, "Trans.Fat..g.": 1, "Saturated.Fat..g.": 1,
+    "Sodium..mg.": 0, "Total.Carbohydrates..g.": 0, "Cholesterol..mg.": 0,
+    "Dietary.Fibre..g.": 0, "Sugars..g.": 0, "Protein..g.": 1, "Caffeine..mg.": 0,
+}
+PERCENT_RAW = ["Vitamin.A....DV.", "Vitamin.C....DV.", "Calcium....DV.", "Iron....DV."]
+ROWS_PER_REGION = 5000
+
+def parse_size(text: str) -> int:
+    """'10k' / '1M' / '10M' / '2500' -> number of rows."""
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+def load_template(path: str = None) -> pd.DataFrame:
+    """The raw menu as strings, exactly as it sits in the CSV."""
+    return pd.read_csv(path or find_data_file(), dtype=str, keep_default_na=False)
+
+def synthetic_menu(n_rows: int, seed: int = 0, template: pd.DataFrame = None, start: int = 0) -> pd.DataFrame:
+    """n_rows of raw-schema menu rows (row ids start at start + 1)."""
+    template = load_template() if template is None else template
+    rng = np.random.default_rng(seed)
+    pick = rng.integers(0, len(template), n_rows)
+    out = {}
+    for col in template.columns:
+        values = template[col].to_numpy(dtype=object)[pick]
+        if col in NUMERIC_RAW or col in PERCENT_RAW:
+            # Parse 242 dòng mẫu một lần rồi mới nhân bản
+            parsed = pd.to_numeric(template[col].str.rstrip("%"), errors="coerce").to_numpy(dtype=np.float64)
+            numeric = parsed[pick]
+            jitter = rng.normal(1.0, 0.08, n_rows).clip(0.7, 1.3)
+            decimals = NUMERIC_RAW.get(col, 0)
+            jittered = np.round(np.nan_to_num(numeric) * jitter, decimals)
+            text = (jittered if decimals else jittered.astype(np.int64)).astype(str).astype(object)
+            if col in PERCENT_RAW:
+                text = text + "%"
+            # Giữ nguyên các giá trị không phải số ("Varies", "3 2", rỗng)
+            values = np.where(np.isnan(numeric), values, text)
+        out[col] = values
+
+    n_regions = max(1, n_rows // ROWS_PER_REGION)
+    region = rng.integers(0, n_regions, n_rows)
+    suffix = np.array([""] + [f" R{r}" for r in range(1, n_regions)], dtype=object)
+    out["Beverage"] = out["Beverage"] + suffix[region]
+    out[template.columns[0]] = np.arange(start + 1, start + n_rows + 1)
+    return pd.DataFrame(out, columns=template.columns)
+
+def write_synthetic_csv(path, n_rows: int, seed: int = 0, chunksize: int = 1_000_000) -> Path:
+    """Write the synthetic menu in chunks so 10M rows never sit in memory at once."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    template = load_template()
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        while written < n_rows:
+            n = min(chunksize, n_rows - written)
+            chunk = synthetic_menu(n, seed=seed + written, template=template, start=written)
+            chunk.to_csv(f, index=False, header=written == 0)
+            written += n
+    return path
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic Starbucks menu CSV.")
+    parser.add_argument("output")
+    parser.add_argument("rows", help="e.g. 10k, 1M, 10M")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_synthetic_csv(args.output, parse_size(args.rows), seed=args.seed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
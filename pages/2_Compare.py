@@ -3,8 +3,8 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 import altair as alt
-import os
-from src.utils import load_data
+from src.data import get_compare_matrix, get_menu
+from src.telemetry import begin_rerun, dev_panel, end_rerun, section
 
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(page_title="Compare Drinks - Decision Support", page_icon="🆚", layout="wide")
@@ -22,38 +22,28 @@ st.markdown("""
 > This tool identifies "Smart Swaps" to help customers optimize their daily intake.
 """)
 
-# --- 2. DATA LOADING (ROBUST) ---
-@st.cache_data
-def get_data():
-    paths = ["data/Nutrition_facts_for_Starbucks_Menu_1604_26.csv", "Nutrition_facts_for_Starbucks_Menu_1604_26.csv"]
-    for path in paths:
-        if os.path.exists(path):
-            return load_data(path)
-    return None
+begin_rerun("2_Compare")
 
-df = get_data()
+# --- 2. DATA LOADING (ROBUST) ---
+section("2_Compare/load")
+df = get_menu()
 
 if df is None:
     st.error("🚨 **File CSV không tìm thấy!** Hãy kiểm tra lại thư mục data.")
     st.stop()
 
-# --- HELPER FUNCTION: LẤY DỮ LIỆU AN TOÀN (CHỐNG BUG) ---
-def get_val(row, key):
-    """Lấy giá trị từ row, thử cả chữ thường và chữ hoa, nếu không có trả về 0"""
-    # Thử các biến thể của key
-    for k in [key, key.lower(), key.capitalize(), key.replace('_', ' ')]:
-        if k in row:
-            val = row[k]
-            try:
-                return float(val) if pd.notna(val) else 0.0
-            except:
-                return 0.0
-    return 0.0
+# Ma trận dinh dưỡng dựng sẵn: tên -> vị trí, delta A/B chỉ là phép trừ hai hàng
+cm = get_compare_matrix()
+
+@st.cache_resource(show_spinner=False)
+def pairwise_csv() -> bytes:
+    """All-pairs distance + delta table of the menu as CSV (built once per process)."""
+    return get_compare_matrix().pairwise_table().to_csv(index=False).encode("utf-8")
 
 # --- 3. SELECTION LOGIC ---
-# Ghép Beverage + Prep để tạo option duy nhất
-df['full_name'] = df['beverage'].astype(str) + " (" + df['prep'].astype(str) + ")"
-options = sorted(df['full_name'].unique().tolist())
+section("2_Compare/selection")
+# Mỗi 'full_name' (Beverage + Prep) là một hàng của ma trận so sánh
+options = sorted(cm.names)
 
 st.subheader("1. Select Beverages to Compare")
 col_sel1, col_sel2 = st.columns(2)
@@ -61,24 +51,25 @@ col_sel1, col_sel2 = st.columns(2)
 with col_sel1:
     st.markdown("### 🥤 Option A (Baseline)")
     choice_a = st.selectbox("Search and select drink", options, key="a_choice")
-    row_a = df[df['full_name'] == choice_a].iloc[0]
+    vec_a = cm.vector(choice_a)
 
 with col_sel2:
     st.markdown("### 🍹 Option B (Alternative)")
     choice_b = st.selectbox("Compare with", options, index=min(1, len(options)-1), key="b_choice")
-    row_b = df[df['full_name'] == choice_b].iloc[0]
+    vec_b = cm.vector(choice_b)
 
 st.divider()
 
 # --- 4. KEY METRIC COMPARISON ---
+section("2_Compare/summary")
 st.subheader("2. Executive Summary: The Trade-off")
 
 m1, m2, m3, m4 = st.columns(4)
 
-# Lấy các chỉ số quan trọng một cách an toàn
-cal_a, cal_b = get_val(row_a, 'calories'), get_val(row_b, 'calories')
-sug_a, sug_b = get_val(row_a, 'sugar_g'), get_val(row_b, 'sugar_g')
-caf_a, caf_b = get_val(row_a, 'caffeine_mg'), get_val(row_b, 'caffeine_mg')
+# Thiếu cột / NaN -> 0
+cal_a, cal_b = vec_a.get('calories', 0.0), vec_b.get('calories', 0.0)
+sug_a, sug_b = vec_a.get('sugar_g', 0.0), vec_b.get('sugar_g', 0.0)
+caf_a, caf_b = vec_a.get('caffeine_mg', 0.0), vec_b.get('caffeine_mg', 0.0)
 
 with m1:
     d_cal = cal_a - cal_b
@@ -101,27 +92,28 @@ with m4:
         st.info("⚖️ Similar Energy Profile")
 
 # --- 5. VISUAL ANALYSIS ---
+section("2_Compare/charts")
 st.divider()
 col_radar, col_bar = st.columns([1.5, 1])
 
 # Danh sách metrics để vẽ chart (Chỉ lấy những gì tồn tại)
 potential_metrics = ['calories', 'sugar_g', 'fat_g', 'protein_g', 'carbs_g']
-existing_metrics = [m for m in potential_metrics if any(k in df.columns for k in [m, m.capitalize()])]
+existing_metrics = [m for m in potential_metrics if m in cm.metrics]
 
 with col_radar:
     st.markdown("**Nutritional Footprint**")
     fig = go.Figure()
     
-    def get_radar_values(row):
-        vals = [get_val(row, m) for m in existing_metrics]
+    def get_radar_values(vec):
+        vals = vec[existing_metrics].tolist()
         # Scale calories để chart đẹp
         if 'calories' in existing_metrics:
             idx = existing_metrics.index('calories')
             vals[idx] = vals[idx] / 5 
         return vals
 
-    for row, name, color in [(row_a, choice_a, '#00704A'), (row_b, choice_b, '#ef553b')]:
-        v = get_radar_values(row)
+    for vec, name, color in [(vec_a, choice_a, '#00704A'), (vec_b, choice_b, '#ef553b')]:
+        v = get_radar_values(vec)
         v.append(v[0]) # Đóng vòng radar
         l = [m.replace('_', ' ').title() for m in existing_metrics]
         if 'Calories' in l: l[l.index('Calories')] = 'Calories (1/5)'
@@ -135,7 +127,7 @@ with col_radar:
 with col_bar:
     st.markdown("**Comparison Delta (A vs B)**")
     
-    diff_values = [get_val(row_a, m) - get_val(row_b, m) for m in existing_metrics]
+    diff_values = cm.delta(choice_a, choice_b)[existing_metrics].tolist()
     diff_df = pd.DataFrame({"Metric": [m.replace('_', ' ').title() for m in existing_metrics], "Diff": diff_values})
     
     bar = alt.Chart(diff_df).mark_bar().encode(
@@ -147,6 +139,7 @@ with col_bar:
     st.altair_chart(bar, use_container_width=True)
 
 # --- 6. SMART SWAP SUMMARY ---
+section("2_Compare/swap_summary")
 st.divider()
 st.subheader("📝 Smart Swap Summary")
 
@@ -163,4 +156,20 @@ if not recs:
 for r in recs:
     st.write(r)
 
-st.caption("Starbucks Portfolio v3.3 | Data Science Project")
\ No newline at end of file
+# --- 7. CLOSEST ALTERNATIVES & EXPORT ---
+section("2_Compare/alternatives")
+with st.expander(f"🔎 Closest alternatives to '{choice_a}'"):
+    same_cat = st.checkbox("Same category only", value=True, key="alt_same_cat")
+    alts = cm.closest(choice_a, k=5, same_category=same_cat)
+    st.caption("Distance is measured on standardized nutrients; deltas are alternative minus A.")
+    st.dataframe(alts.round(2), hide_index=True, use_container_width=True)
+
+with st.expander("📦 Bulk pairwise export"):
+    st.caption(f"Every ordered pair of the {len(cm.names)} drinks with distance and per-nutrient deltas (A - B).")
+    if st.button("Build all-pairs CSV", key="build_pairs"):
+        st.download_button("Download pairwise_deltas.csv", pairwise_csv(), file_name="pairwise_deltas.csv", mime="text/csv")
+
+st.caption("Starbucks Portfolio v3.3 | Data Science Project")
+
+end_rerun()
+dev_panel()
@@ -2,8 +2,9 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
-import os
-from src.utils import load_data
+from src.utils import PERSONAS, persona_top_k
+from src.data import get_members, get_menu, get_neighbor_index, get_pareto_front, get_persona_scores, get_swap_index, get_swap_table
+from src.telemetry import begin_rerun, dev_panel, end_rerun, section
 
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(page_title="Starbucks Smart Choice Engine", page_icon="💡", layout="wide")
@@ -15,20 +16,11 @@ st.markdown("""
 > This engine uses a **Nearest-Healthier-Neighbor** logic to find alternatives that preserve your flavor preferences while slashing unnecessary calories and sugar.
 """)
 
+begin_rerun("3_Recommender")
+
 # --- 2. DATA LOADING (ULTRA ROBUST) ---
-@st.cache_data
-def get_data():
-    paths = [
-        "data/Nutrition_facts_for_Starbucks_Menu_1604_26 (1).csv",
-        "data/Nutrition_facts_for_Starbucks_Menu_1604_26.csv",
-        "Nutrition_facts_for_Starbucks_Menu_1604_26.csv"
-    ]
-    for path in paths:
-        if os.path.exists(path):
-            return load_data(path)
-    return None
-
-df = get_data()
+section("3_Recommender/load")
+df = get_menu()
 
 if df is None:
     st.error("🚨 **Data Source Missing!** Please ensure the CSV is in the data folder.")
@@ -45,6 +37,7 @@ def get_val(row, key, default=0):
     return default
 
 # --- 3. FEATURE 1: THE SMART SWAP ENGINE ---
+section("3_Recommender/smart_swap")
 st.header("🚀 1. The 'Smart Swap' Finder")
 st.info("Pick your 'Guilty Pleasure' below, and our AI logic will find the healthiest version within that same category.")
 
@@ -54,17 +47,15 @@ all_beverages = sorted(df['beverage'].unique())
 c1, c2 = st.columns(2)
 with c1:
     target_bev = st.selectbox("I usually order:", all_beverages, index=0)
-    available_preps = df[df['beverage'] == target_bev]['prep'].unique()
+    available_preps = get_members().select(beverage=target_bev)['prep'].unique()
     target_prep = st.selectbox("Preparation / Size:", available_preps)
 
 # Get the "Original" drink
-original_drink = df[(df['beverage'] == target_bev) & (df['prep'] == target_prep)].iloc[0]
+original_drink = get_members().select(beverage=target_bev, prep=target_prep).iloc[0]
 
 # RECOMMENDATION LOGIC:
-recommendations = df[df['category'] == original_drink['category']].copy()
-# Tìm những món có calo thấp hơn món hiện tại
-recommendations = recommendations[recommendations['calories'] < original_drink['calories']]
-recommendations = recommendations.sort_values(by=['calories', 'sugar_g'], ascending=True)
+# Món ít calo nhất cùng category, miễn là calo thấp hơn món hiện tại (SwapIndex dựng sẵn một lần)
+recommendations = get_swap_index(("category",)).lightest(original_drink)
 
 st.divider()
 
@@ -108,50 +99,86 @@ if not recommendations.empty:
 else:
     st.warning("You are already picking the healthiest option in this category! Great job.")
 
+# Nearest-Healthier-Neighbor: giống nhất về dinh dưỡng nhưng ít calo/đường hơn
+st.markdown("### 🧬 Similar but Lighter")
+st.caption("Closest drinks in the same category by overall nutrition profile (standardized), with no more calories or sugar.")
+neighbors = get_neighbor_index().query(df.index.get_loc(original_drink.name), k=5)
+if not neighbors.empty:
+    st.dataframe(neighbors[['beverage', 'prep', 'calories', 'sugar_g', 'distance']].round({'distance': 2}),
+                 use_container_width=True, hide_index=True)
+else:
+    st.info("No lighter drink with a similar profile in this category.")
+
+with st.expander("📋 Menu-wide Swap Table"):
+    st.caption("Best healthier swap for every drink: same category & prep first, then same category, then the whole menu.")
+    swap_table = df[['beverage', 'prep', 'category']].join(get_swap_table())
+    st.dataframe(swap_table, use_container_width=True, hide_index=True)
+    st.download_button("⬇️ Download swap report (CSV)", swap_table.to_csv(index=False), "swap_report.csv", "text/csv")
+
 st.divider()
 
 # --- 4. FEATURE 2: LIFESTYLE TARGETS ---
+section("3_Recommender/personas")
 st.header("🎯 2. Global Menu Optimization")
 st.write("Not sure what you want? Tell us your diet profile.")
 
-persona = st.selectbox("Select your Health Persona:", 
-                      ["Weight Loss (Low Calorie)", 
-                       "Low Carb / Keto (Low Sugar & Fat)", 
-                       "The Clean Caffeine Boost (Max Caffeine/Min Sugar)"])
-
-if persona == "Weight Loss (Low Calorie)":
-    max_c, max_s, sort_f = 150, 20, "calories"
-elif persona == "Low Carb / Keto (Low Sugar & Fat)":
-    max_c, max_s, sort_f = 250, 5, "sugar_g"
-else:
-    max_c, max_s, sort_f = 200, 5, "caffeine_mg"
+persona = st.selectbox("Select your Health Persona:", list(PERSONAS))
 
-# Filter based on persona
-filtered_menu = df[(df['calories'] <= max_c) & (df['sugar_g'] <= max_s)]
+# Mọi persona được chấm điểm một lần trên toàn menu (ma trận điểm dùng chung)
+top_picks = persona_top_k(df, k=5, scores=get_persona_scores())[persona]
 
 st.markdown(f"### Top 5 Recommendations for **{persona}**")
 
-# CHỖ NÀY LÀ QUAN TRỌNG NHẤT: Kiểm tra xem cột có tồn tại không trước khi hiện bảng
 desired_cols = ['beverage', 'prep', 'category', 'calories', 'sugar_g', 'caffeine_mg']
-available_cols = [c for c in desired_cols if c in filtered_menu.columns]
-
-if not filtered_menu.empty:
-    st.dataframe(
-        filtered_menu[available_cols]
-        .sort_values(by=sort_f if sort_f in filtered_menu.columns else available_cols[0], 
-                     ascending=(persona != "The Clean Caffeine Boost"))
-        .head(5),
-        use_container_width=True, hide_index=True
-    )
+available_cols = [c for c in desired_cols if c in top_picks.columns]
+
+if not top_picks.empty:
+    st.dataframe(top_picks[available_cols], use_container_width=True, hide_index=True)
 else:
     st.info("No drinks match this specific persona perfectly.")
 
-# --- 5. TECHNICAL CONTEXT ---
+# --- 5. FEATURE 3: PARETO-OPTIMAL PICKS ---
+section("3_Recommender/pareto")
+st.divider()
+st.header("🧭 3. Best Trade-offs (Pareto Frontier)")
+st.write("Drinks that no other drink in the same category beats on **every** objective you pick.")
+
+objective_labels = {
+    "Fewer Calories": ("calories", "min"),
+    "Less Sugar": ("sugar_g", "min"),
+    "Less Fat": ("fat_g", "min"),
+    "More Caffeine": ("caffeine_mg", "max"),
+    "More Protein": ("protein_g", "max"),
+}
+p1, p2 = st.columns([2, 1])
+with p1:
+    chosen = st.multiselect("Objectives:", list(objective_labels), default=["Fewer Calories", "Less Sugar", "More Caffeine"])
+with p2:
+    front_cat = st.selectbox("Category:", sorted(df['category'].unique()),
+                             index=sorted(df['category'].unique()).index(original_drink['category']))
+
+objectives = tuple(objective_labels[c] for c in chosen if objective_labels[c][0] in df.columns)
+if objectives:
+    front = get_pareto_front(objectives)
+    front = front[front['category'] == front_cat]
+    show_cols = [c for c in ['beverage', 'prep'] + [c for c, _ in objectives] if c in front.columns]
+    st.dataframe(front[show_cols].sort_values(objectives[0][0], ascending=objectives[0][1] == "min"),
+                 use_container_width=True, hide_index=True)
+    st.caption(f"{len(front)} non-dominated drinks in {front_cat}.")
+else:
+    st.info("Pick at least one objective.")
+
+# --- 6. TECHNICAL CONTEXT ---
+section("3_Recommender/about")
 st.divider()
 with st.expander("🛠️ How does the Recommender work?"):
     st.markdown("""
     - **Logic:** Locks search to the same category to maintain flavor profile.
+    - **Similarity:** Nutrients are standardized and searched with a per-category KD-tree, keeping only drinks that are no worse on calories and sugar.
     - **Data Handling:** Custom `get_val` prevents crashes if columns like `caffeine_mg` are formatted as strings or missing.
     """)
 
-st.caption("Starbucks Decision Support System | Product Mindset Portfolio v3.6")
\ No newline at end of file
+st.caption("Starbucks Decision Support System | Product Mindset Portfolio v3.6")
+
+end_rerun()
+dev_panel()
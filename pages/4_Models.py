@@ -1,44 +1,45 @@
+import io
 import streamlit as st
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
-from sklearn.model_selection import train_test_split
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
 import altair as alt
-from src.utils import load_data, get_clean_data_for_ml 
+from src.utils import lazy_import
+from src.data import get_menu
+from src.models import KNN_GRID, cluster_sweep, fit_knn, knn_cv_search
+from src.telemetry import begin_rerun, dev_panel, end_rerun, section
+
+# matplotlib/seaborn chỉ load khi vẽ confusion matrix lần đầu
+mpl_figure = lazy_import("matplotlib.figure")
+sns = lazy_import("seaborn")
 
 st.set_page_config(page_title="Models", page_icon="🧠")
 st.title("🧠 Machine Learning Models")
 
-@st.cache_data
-def get_df():
-    return load_data("data/Nutrition_facts_for_Starbucks_Menu_1604_26.csv")
+begin_rerun("4_Models")
+section("4_Models/load")
+df = get_menu()
 
-df = get_df()
+if df is None:
+    st.error("Không tìm thấy file dữ liệu CSV trong thư mục data.")
+    st.stop()
 
 # --- 1. CLUSTERING (K-MEANS) ---
+section("4_Models/clustering")
 st.header("1. Clustering (Phân nhóm đồ uống)")
 st.write("Tự động nhóm các món nước dựa trên thành phần dinh dưỡng.")
 
-# Lấy dữ liệu sạch (không cần target category cho clustering)
-X_cluster, _, _ = get_clean_data_for_ml(df, target_col=None)
+# Fit sẵn mọi k (2..6) song song, slider chỉ chọn kết quả đã tính
+sweep = cluster_sweep(df, ks=range(2, 7))
 
 k = st.slider("Chọn số lượng nhóm (Clusters)", 2, 6, 3)
+st.caption(f"💡 Gợi ý: k = {sweep['best_k']} (silhouette cao nhất)")
 
-# Scale dữ liệu (Quan trọng cho KMeans)
-scaler_cluster = StandardScaler()
-X_cluster_scaled = scaler_cluster.fit_transform(X_cluster)
-
-kmeans = KMeans(n_clusters=k, n_init=10, random_state=42)
-df["cluster"] = kmeans.fit_predict(X_cluster_scaled)
+# Không ghi vào dataset dùng chung -> tạo bản sao có cột cluster
+df_cluster = df.assign(cluster=sweep["labels"][k])
 
 # Biểu đồ Clustering
 if "calories" in df.columns and "sugar_g" in df.columns:
-    chart = alt.Chart(df).mark_circle(size=60).encode(
+    chart = alt.Chart(df_cluster).mark_circle(size=60).encode(
         x=alt.X("calories", title="Calories"),
         y=alt.Y("sugar_g", title="Sugar (g)"),
         color=alt.Color("cluster:N", title="Cluster"),
@@ -48,48 +49,62 @@ if "calories" in df.columns and "sugar_g" in df.columns:
 else:
     st.warning("Thiếu dữ liệu để vẽ biểu đồ.")
 
+with st.expander("Chất lượng phân nhóm theo k (Inertia / Silhouette / Davies–Bouldin)"):
+    st.dataframe(sweep["results"].set_index("k").round(3), use_container_width=True)
+    st.caption("Silhouette càng cao càng tốt; Davies–Bouldin càng thấp càng tốt.")
+
 st.markdown("---")
 
 # --- 2. CLASSIFICATION (KNN) ---
+section("4_Models/classification")
 st.header("2. Predict Category (Dự đoán loại nước)")
 st.write("Sử dụng KNN để đoán xem món nước thuộc loại nào (VD: Coffee, Smoothie...) dựa trên dinh dưỡng.")
 
 if 'category' in df.columns:
-    # 1. Lấy dữ liệu sạch từ utils (Có target category)
-    X, y, features = get_clean_data_for_ml(df, target_col="category")
-    
+    # 1. Cross-validation cho toàn bộ lưới tham số (chạy song song một lần, cache trong registry)
+    cv = knn_cv_search(df, target_col="category")
+    features = cv["features"]
+    best_k, best_w, best_m = cv["best"]
+
     # 2. Sidebar chỉnh tham số
     n_neighbors = st.slider("Số lượng láng giềng (K-Neighbors)", 1, 15, 5)
+    c_w, c_m = st.columns(2)
+    weights = c_w.selectbox("Trọng số (weights)", KNN_GRID["weights"])
+    metric = c_m.selectbox("Khoảng cách (metric)", KNN_GRID["metric"])
+    st.caption(f"💡 Tốt nhất theo CV: k = {best_k}, weights = {best_w}, metric = {best_m}")
     
-    # 3. Train/Test Split & Scaling
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-    
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # 4. Train Model
-    knn = KNeighborsClassifier(n_neighbors=n_neighbors)
-    knn.fit(X_train_scaled, y_train)
-    y_pred = knn.predict(X_test_scaled)
+    # 3-4. Kết quả CV của tham số đã chọn + model dùng để dự đoán (fit trên toàn bộ dữ liệu)
+    setting = cv["settings"][(n_neighbors, weights, metric)]
+    knn_fit = fit_knn(df, n_neighbors, weights=weights, metric=metric, test_size=None)
+    scaler, knn = knn_fit["scaler"], knn_fit["model"]
     
     # 5. Hiển thị Metrics
-    acc = accuracy_score(y_test, y_pred)
-    st.metric("Độ chính xác (Accuracy)", f"{acc*100:.1f}%")
+    # Cùng định nghĩa với best: accuracy trung bình qua các fold
+    acc = setting["accuracy"]
+    st.metric("Độ chính xác (Accuracy)", f"{acc*100:.1f}%", delta=f"± {setting['accuracy_std']*100:.1f}%", delta_color="off",
+              help=f"Mean accuracy over stratified {cv['n_splits']}-fold cross-validation (± std across folds)")
     
     with st.expander("Xem chi tiết báo cáo (Classification Report)"):
-        st.text(classification_report(y_test, y_pred))
+        st.text(setting["report"])
 
     # 6. Confusion Matrix (Biểu đồ nhiệt)
     st.subheader("Biểu đồ nhầm lẫn (Confusion Matrix)")
-    st.caption("Giúp bạn biết Model đang hay nhầm lẫn giữa các loại nào.")
+    st.caption("Giúp bạn biết Model đang hay nhầm lẫn giữa các loại nào (dự đoán out-of-fold).")
     
-    fig, ax = plt.subplots(figsize=(8, 6))
-    cm = confusion_matrix(y_test, y_pred, labels=knn.classes_)
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues', 
-                xticklabels=knn.classes_, yticklabels=knn.classes_, ax=ax)
-    plt.xticks(rotation=45, ha='right')
-    st.pyplot(fig)
+    # Cache ảnh PNG (bytes, bất biến) thay vì Figure dùng chung giữa các thread; Figure không qua pyplot
+    @st.cache_data(show_spinner=False)
+    def confusion_png(confusion, classes):
+        fig = mpl_figure.Figure(figsize=(8, 6))
+        ax = fig.subplots()
+        sns.heatmap(confusion, annot=True, fmt='d', cmap='Blues', xticklabels=classes, yticklabels=classes, ax=ax)
+        for label in ax.get_xticklabels():
+            label.set_rotation(45)
+            label.set_ha('right')
+        buf = io.BytesIO()
+        fig.savefig(buf, format="png", bbox_inches="tight")
+        return buf.getvalue()
+
+    st.image(confusion_png(setting["confusion"], list(cv["classes"])))
 
     # --- 3. INTERACTIVE PREDICTION (Dùng thử) ---
     st.markdown("---")
@@ -101,7 +116,7 @@ if 'category' in df.columns:
         input_data = {}
         for i, col in enumerate(features):
             # Lấy giá trị trung bình để làm gợi ý mặc định
-            default_val = float(X[col].median())
+            default_val = float(knn_fit["medians"][col])
             with cols[i % 3]:
                 input_data[col] = st.number_input(f"{col}", value=default_val)
         
@@ -134,4 +149,7 @@ if 'category' in df.columns:
         st.altair_chart(c, use_container_width=True)
 
 else:
-    st.error("Không tìm thấy cột 'category' trong dữ liệu.")
\ No newline at end of file
+    st.error("Không tìm thấy cột 'category' trong dữ liệu.")
+
+end_rerun()
+dev_panel()
@@ -0,0 +1,94 @@
+import os
+
+import streamlit as st
+from src.utils import STREAM_THRESHOLD_BYTES, CompareMatrix, HealthierNeighborIndex, MembershipIndex, build_corr_stats, build_nutrient_cube, NutrientRangeIndex, SwapIndex, find_data_file, healthier_alternatives_bulk, load_menu, pareto_front, persona_scores, stream_nutrient_cube
+
+# MENU_COMPACT=1 -> menu dùng categorical + float32/int16 (xem compact_frame)
+COMPACT_MENU = os.environ.get("MENU_COMPACT", "") not in ("", "0")
+
+# --- Dataset dùng chung cho mọi trang ---
+@st.cache_resource(show_spinner=False)
+def get_menu():
+    """
+    Load the menu once per process and share it across pages and sessions.
+    The same DataFrame object is returned to every caller, so treat it as
+    read-only (use .assign()/.copy() before adding columns).
+    Returns None when the CSV cannot be found.
+    """
+    path = find_data_file()
+    if path is None:
+        return None
+    return load_menu(path, compact=COMPACT_MENU)
+
+@st.cache_resource(show_spinner=False)
+def get_swap_index(by=("category", "prep")):
+    """SwapIndex over the shared menu, built once per grouping."""
+    df = get_menu()
+    return SwapIndex(df, by=by) if df is not None else None
+
+@st.cache_resource(show_spinner=False)
+def get_swap_table():
+    """Best healthier swap for every menu item (healthier_alternatives_bulk), computed once."""
+    df = get_menu()
+    return healthier_alternatives_bulk(df) if df is not None else None
+
+@st.cache_resource(show_spinner=False)
+def get_pareto_front(objectives: tuple, by="category"):
+    """Skyline of the shared menu, cached per objective set ((column, "min"|"max"), ...)."""
+    df = get_menu()
+    return pareto_front(df, dict(objectives), by=by) if df is not None else None
+
+@st.cache_resource(show_spinner=False)
+def get_neighbor_index():
+    """Per-category KD-trees over the standardized nutrient vectors of the shared menu."""
+    df = get_menu()
+    return HealthierNeighborIndex(df) if df is not None else None
+
+@st.cache_resource(show_spinner=False)
+def get_range_index():
+    """NutrientRangeIndex over the shared menu for "<= X" filters."""
+    df = get_menu()
+    return NutrientRangeIndex(df) if df is not None else None
+
+@st.cache_resource(show_spinner=False)
+def get_persona_scores():
+    """Score matrix (rows x PERSONAS) of the shared menu, computed once."""
+    df = get_menu()
+    return persona_scores(df, index=get_range_index()) if df is not None else None
+
+def is_large_feed() -> bool:
+    """True when the menu CSV is above STREAM_THRESHOLD_BYTES (home page runs from the streamed cube only)."""
+    path = find_data_file()
+    return path is not None and os.path.getsize(path) > STREAM_THRESHOLD_BYTES
+
+@st.cache_resource(show_spinner=False)
+def get_cube():
+    """
+    Aggregate cube over (category, prep, health_tier) for filter-driven KPI panels.
+    Files above STREAM_THRESHOLD_BYTES are folded chunk by chunk straight from the CSV,
+    so the KPIs never need the full frame in memory.
+    """
+    path = find_data_file()
+    if path is None:
+        return None
+    if is_large_feed():
+        return stream_nutrient_cube(path)
+    return build_nutrient_cube(get_menu())
+
+@st.cache_resource(show_spinner=False)
+def get_corr_stats(ranks: bool = False):
+    """Cross-product blocks per (category, health_tier) for the correlation heatmap."""
+    df = get_menu()
+    return build_corr_stats(df, ranks=ranks) if df is not None else None
+
+@st.cache_resource(show_spinner=False)
+def get_members():
+    """MembershipIndex (codes, plus per-level bitsets for category/prep/tier) for the page filters."""
+    df = get_menu()
+    return MembershipIndex(df) if df is not None else None
+
+@st.cache_resource(show_spinner=False)
+def get_compare_matrix():
+    """CompareMatrix (name -> row, dense nutrients, on-demand distances) for the Compare page."""
+    df = get_menu()
+    return CompareMatrix(df) if df is not None else None
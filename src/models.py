@@ -0,0 +1,308 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.telemetry import timed
+from src.utils import PROJECT_ROOT, get_clean_data_for_ml, lazy_import
+
+# joblib / scikit-learn chỉ được import khi thực sự fit hoặc load model
+joblib = lazy_import("joblib")
+cluster = lazy_import("sklearn.cluster")
+metrics = lazy_import("sklearn.metrics")
+model_selection = lazy_import("sklearn.model_selection")
+neighbors = lazy_import("sklearn.neighbors")
+preprocessing = lazy_import("sklearn.preprocessing")
+
+MODEL_CACHE_DIR = PROJECT_ROOT / "data" / ".cache" / "models"
+
+# --- 1. Model registry ---
+# Tăng khi code fit / cấu trúc artifact thay đổi -> artifact cũ không còn khớp key
+MODEL_CACHE_VERSION = 3
+# Số artifact giữ lại trên đĩa cho mỗi kind (mới nhất)
+MAX_ARTIFACTS_PER_KIND = 8
+
+def data_fingerprint(X: pd.DataFrame, y: pd.Series = None) -> str:
+    """Content hash of the exact feature matrix (and target) a model is fitted on."""
+    h = hashlib.sha1(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    if y is not None:
+        h.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def _sklearn_version() -> str:
+    # Đọc metadata thay vì import sklearn (giữ import-time budget)
+    try:
+        from importlib.metadata import version
+        return version("scikit-learn")
+    except Exception:
+        return "unknown"
+
+class ModelRegistry:
+    """
+    Fitted scalers/models keyed by (kind, data hash, feature list, hyperparameters,
+    cache/scikit-learn version). Artifacts live in memory for the process and are
+    persisted with joblib so a new process loads them instead of refitting; only the
+    newest MAX_ARTIFACTS_PER_KIND files per kind are kept on disk.
+    """
+
+    def __init__(self, cache_dir=MODEL_CACHE_DIR, max_per_kind: int = MAX_ARTIFACTS_PER_KIND):
+        self.cache_dir = Path(cache_dir)
+        self.max_per_kind = max_per_kind
+        self._memory = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    @staticmethod
+    def make_key(kind: str, fingerprint: str, features, params: dict) -> str:
+        payload = json.dumps([kind, fingerprint, list(features), params, MODEL_CACHE_VERSION, _sklearn_version()],
+                             sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode()).hexdigest()[:20]
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.cache_dir / f"{kind}-{key}.joblib"
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_or_fit(self, kind: str, fingerprint: str, features, params: dict, fit_fn):
+        """Return the cached artifact for this key, fitting (and persisting) it with fit_fn() on a miss."""
+        key = self.make_key(kind, fingerprint, features, params)
+        # Khóa theo key: hai model khác nhau fit song song, cùng một model chỉ fit một lần
+        with self._key_lock(key):
+            artifact = self._memory.get(key)
+            if artifact is not None:
+                return artifact
+            path = self._path(kind, key)
+            if path.exists():
+                try:
+                    artifact = joblib.load(path)
+                except Exception:
+                    artifact = None
+            if artifact is None:
+                artifact = fit_fn()
+                self._save(artifact, path)
+                self._prune(kind)
+            self._memory[key] = artifact
+            return artifact
+
+    def _save(self, artifact, path: Path):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+            joblib.dump(artifact, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            # Không ghi được đĩa -> chỉ giữ trong bộ nhớ
+            pass
+
+    def _prune(self, kind: str):
+        """Drop all but the newest max_per_kind artifacts of this kind."""
+        try:
+            files = sorted(self.cache_dir.glob(f"{kind}-*.joblib"), key=lambda p: p.stat().st_mtime, reverse=True)
+            for old in files[self.max_per_kind:]:
+                old.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+REGISTRY = ModelRegistry()
+
+# --- 2. Các model của trang 4_Models ---
+@timed()
+def fit_kmeans(df: pd.DataFrame, k: int, random_state: int = 42, registry: ModelRegistry = REGISTRY) -> dict:
+    """StandardScaler + cluster.KMeans(n_init=10) on the ML features; returns scaler, model, labels."""
+    X, _, features = get_clean_data_for_ml(df, target_col=None)
+    params = {"k": k, "n_init": 10, "random_state": random_state}
+
+    def fit():
+        scaler = preprocessing.StandardScaler().fit(X)
+        model = cluster.KMeans(n_clusters=k, n_init=10, random_state=random_state)
+        labels = model.fit_predict(scaler.transform(X))
+        return {"scaler": scaler, "model": model, "labels": labels, "features": features}
+
+    return registry.get_or_fit("kmeans", data_fingerprint(X), features, params, fit)
+
+@timed()
+def fit_knn(df: pd.DataFrame, n_neighbors: int, target_col: str = "category", test_size: float = 0.2,
+            random_state: int = 42, weights: str = "uniform", metric: str = "minkowski",
+            registry: ModelRegistry = REGISTRY) -> dict:
+    """
+    KNN category classifier on a stratified train/test split.
+    Returns scaler, model, features, training medians and the held-out metrics
+    (accuracy, classification report, confusion matrix).
+    With test_size=None the model is fitted on every row and the metrics are None.
+    """
+    X, y, features = get_clean_data_for_ml(df, target_col=target_col)
+    params = {"n_neighbors": n_neighbors, "target": target_col, "test_size": test_size, "random_state": random_state,
+              "weights": weights, "metric": metric}
+
+    def fit():
+        if test_size:
+            X_train, X_test, y_train, y_test = model_selection.train_test_split(X, y, test_size=test_size, random_state=random_state, stratify=y)
+        else:
+            X_train, y_train = X, y
+        scaler = preprocessing.StandardScaler().fit(X_train)
+        model = neighbors.KNeighborsClassifier(n_neighbors=n_neighbors, weights=weights, metric=metric)
+        model.fit(scaler.transform(X_train), y_train)
+        artifact = {"scaler": scaler, "model": model, "features": features, "medians": X.median(),
+                    "accuracy": None, "report": None, "confusion": None}
+        if test_size:
+            y_pred = model.predict(scaler.transform(X_test))
+            artifact.update(
+                accuracy=metrics.accuracy_score(y_test, y_pred),
+                report=metrics.classification_report(y_test, y_pred),
+                confusion=metrics.confusion_matrix(y_test, y_pred, labels=model.classes_),
+            )
+        return artifact
+
+    return registry.get_or_fit("knn", data_fingerprint(X, y), features, params, fit)
+
+# --- 3. Clustering sweep ---
+def _fit_kmeans_seed(Z: np.ndarray, k: int, seed: int):
+    model = cluster.KMeans(n_clusters=k, n_init=1, random_state=seed).fit(Z)
+    return k, seed, model.inertia_, model
+
+def _cluster_quality(Z: np.ndarray, labels: np.ndarray, sample_size: int = 10000):
+    # silhouette là O(n^2) -> lấy mẫu khi menu lớn
+    sample = min(len(Z), sample_size) if len(Z) > sample_size else None
+    return metrics.silhouette_score(Z, labels, sample_size=sample, random_state=0), metrics.davies_bouldin_score(Z, labels)
+
+@timed()
+def cluster_sweep(df: pd.DataFrame, ks=range(2, 7), seeds=range(10), n_jobs: int = -1,
+                  registry: ModelRegistry = REGISTRY) -> dict:
+    """
+    Fit KMeans for every (k, seed) in parallel worker processes, keep the lowest-inertia seed
+    per k (the same thing n_init does, spread across cores) and score it with silhouette
+    and Davies-Bouldin. Returns scaler, features, a per-k results table, labels and models
+    per k, and best_k (highest silhouette).
+    """
+    X, _, features = get_clean_data_for_ml(df, target_col=None)
+    ks, seeds = [int(k) for k in ks], [int(s) for s in seeds]
+    params = {"ks": ks, "seeds": seeds}
+
+    def fit():
+        scaler = preprocessing.StandardScaler().fit(X)
+        Z = scaler.transform(X)
+        fits = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(_fit_kmeans_seed)(Z, k, seed) for k in ks for seed in seeds)
+        best = {}
+        for k, seed, inertia, model in fits:
+            if k not in best or inertia < best[k][1]:
+                best[k] = (seed, inertia, model)
+        quality = joblib.Parallel(n_jobs=n_jobs)(joblib.delayed(_cluster_quality)(Z, best[k][2].labels_) for k in ks)
+        results = pd.DataFrame({
+            "k": ks,
+            "seed": [best[k][0] for k in ks],
+            "inertia": [best[k][1] for k in ks],
+            "silhouette": [q[0] for q in quality],
+            "davies_bouldin": [q[1] for q in quality],
+        })
+        return {
+            "scaler": scaler,
+            "features": features,
+            "results": results,
+            "labels": {k: best[k][2].labels_ for k in ks},
+            "models": {k: best[k][2] for k in ks},
+            "best_k": int(results.loc[results["silhouette"].idxmax(), "k"]),
+        }
+
+    return registry.get_or_fit("kmeans_sweep", data_fingerprint(X), features, params, fit)
+
+# --- 4. KNN hyperparameter search (cross-validation) ---
+KNN_GRID = {
+    "n_neighbors": list(range(1, 16)),
+    "weights": ["uniform", "distance"],
+    "metric": ["euclidean", "manhattan"],
+}
+
+def _fold_neighbors(X: np.ndarray, y_codes: np.ndarray, train: np.ndarray, test: np.ndarray, metric: str, k_max: int):
+    """One neighbour graph per (fold, metric): the k_max nearest training rows of every test row."""
+    scaler = preprocessing.StandardScaler().fit(X[train])
+    nn = neighbors.NearestNeighbors(n_neighbors=min(k_max, len(train)), metric=metric).fit(scaler.transform(X[train]))
+    dist, ind = nn.kneighbors(scaler.transform(X[test]))
+    return metric, test, dist, y_codes[train][ind]
+
+def _knn_vote(dist: np.ndarray, nb_labels: np.ndarray, k: int, weights: str, n_classes: int) -> np.ndarray:
+    """KNeighborsClassifier.predict from a precomputed neighbour graph (same tie and zero-distance rules)."""
+    d, labels = dist[:, :k], nb_labels[:, :k]
+    if weights == "distance":
+        with np.errstate(divide="ignore"):
+            w = 1.0 / d
+        exact = d == 0
+        has_exact = exact.any(axis=1)
+        w[has_exact] = exact[has_exact]
+    else:
+        w = np.ones_like(d)
+    votes = np.zeros((len(d), n_classes))
+    np.add.at(votes, (np.arange(len(d))[:, None], labels), w)
+    return votes.argmax(axis=1)
+
+@timed()
+def knn_cv_search(df: pd.DataFrame, target_col: str = "category", grid: dict = None, n_splits: int = 5,
+                  random_state: int = 42, n_jobs: int = -1, registry: ModelRegistry = REGISTRY) -> dict:
+    """
+    Stratified k-fold CV over n_neighbors x weights x metric.
+    Each (fold, metric) neighbour graph is computed once, in parallel, at the largest k;
+    every n_neighbors/weights setting is then a vote over a prefix of that graph.
+    Returns the results grid plus, per setting, the mean/std fold accuracy (the number `best`
+    is chosen on) and the report and confusion matrix of the out-of-fold predictions.
+    """
+    grid = {**KNN_GRID, **(grid or {})}
+    X, y, features = get_clean_data_for_ml(df, target_col=target_col)
+    params = {"target": target_col, "grid": grid, "n_splits": n_splits, "random_state": random_state}
+
+    def fit():
+        X_arr = X.to_numpy(dtype=np.float64)
+        y_codes, classes = pd.factorize(y, sort=True)
+        classes = np.asarray(classes)
+        # Không chia được nhiều fold hơn số mẫu của lớp nhỏ nhất
+        splits = max(2, min(n_splits, int(np.bincount(y_codes).min())))
+        folds = list(model_selection.StratifiedKFold(n_splits=splits, shuffle=True, random_state=random_state).split(X_arr, y_codes))
+        k_max = max(grid["n_neighbors"])
+        graphs = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(_fold_neighbors)(X_arr, y_codes, train, test, metric, k_max)
+            for train, test in folds for metric in grid["metric"]
+        )
+
+        rows, settings = [], {}
+        for metric in grid["metric"]:
+            metric_graphs = [g for g in graphs if g[0] == metric]
+            for weights in grid["weights"]:
+                for k in grid["n_neighbors"]:
+                    oof = np.empty(len(y_codes), dtype=np.int64)
+                    fold_acc = []
+                    for _, test, dist, nb_labels in metric_graphs:
+                        pred = _knn_vote(dist, nb_labels, k, weights, len(classes))
+                        oof[test] = pred
+                        fold_acc.append((pred == y_codes[test]).mean())
+                    y_true, y_pred = classes[y_codes], classes[oof]
+                    settings[(k, weights, metric)] = {
+                        "accuracy": float(np.mean(fold_acc)),
+                        "accuracy_std": float(np.std(fold_acc)),
+                        "report": metrics.classification_report(y_true, y_pred, zero_division=0),
+                        "confusion": metrics.confusion_matrix(y_true, y_pred, labels=classes),
+                    }
+                    rows.append({"n_neighbors": k, "weights": weights, "metric": metric,
+                                 "accuracy": float(np.mean(fold_acc)), "accuracy_std": float(np.std(fold_acc))})
+        results = pd.DataFrame(rows)
+        best = results.loc[results["accuracy"].idxmax()]
+        return {
+            "features": features,
+            "classes": classes,
+            "n_splits": splits,
+            "results": results,
+            "settings": settings,
+            "best": (int(best["n_neighbors"]), best["weights"], best["metric"]),
+        }
+
+    return registry.get_or_fit("knn_cv", data_fingerprint(X, y), features, params, fit)
+
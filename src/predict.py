@@ -0,0 +1,114 @@
+"""
+Batch category prediction for nutrition files.
+
+    python -m src.predict supplier_feed.csv predictions.csv --chunksize 100000
+
+Input is read in chunks (CSV or Parquet), normalized like the menu, imputed with the
+medians frozen at training time, scaled and scored a whole chunk at a time; each chunk's
+labels and class probabilities are appended to the output (CSV or Parquet).
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from src.models import fit_knn, knn_cv_search
+from src.utils import find_data_file, get_clean_data_for_ml, load_menu, normalize_columns
+
+# --- 1. Model ---
+def load_classifier(data_path: str = None, n_neighbors: int = None, weights: str = None, metric: str = None) -> dict:
+    """KNN bundle fitted on the full menu (from the model registry); defaults to the best CV setting."""
+    menu = load_menu(data_path or find_data_file())
+    if n_neighbors is None or weights is None or metric is None:
+        best_k, best_w, best_m = knn_cv_search(menu)["best"]
+        n_neighbors = n_neighbors or best_k
+        weights = weights or best_w
+        metric = metric or best_m
+    return fit_knn(menu, n_neighbors, weights=weights, metric=metric, test_size=None)
+
+# --- 2. Đọc / ghi theo từng chunk ---
+def iter_chunks(path: str, chunksize: int):
+    if Path(path).suffix.lower() in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize)
+
+class ChunkWriter:
+    """Append DataFrames to a CSV or Parquet file without holding earlier chunks in memory."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.parquet = Path(path).suffix.lower() in (".parquet", ".pq")
+        self._writer = None
+        self._first = True
+
+    def write(self, df: pd.DataFrame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # Schema cố định từ chunk đầu: cột toàn null ở chunk sau bị đoán là double
+                table = table.cast(self._writer.schema)
+            self._writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+# --- 3. Dự đoán ---
+def predict_chunk(chunk: pd.DataFrame, bundle: dict, keep_cols=("beverage", "prep")) -> pd.DataFrame:
+    """Labels + per-class probabilities for one chunk of raw rows."""
+    chunk = normalize_columns(chunk)
+    features = bundle["features"]
+    # Thiếu cột nào thì cột đó được điền bằng median lúc train
+    X_raw = chunk.reindex(columns=features)
+    X, _, _ = get_clean_data_for_ml(X_raw, target_col=None, medians=bundle["medians"])
+    model = bundle["model"]
+    probs = model.predict_proba(bundle["scaler"].transform(X[features]))
+
+    # Cột giữ lại luôn là string, kể cả khi cả chunk là null
+    out = chunk[[c for c in keep_cols if c in chunk.columns]].reset_index(drop=True).astype("string")
+    out["predicted_category"] = model.classes_[probs.argmax(axis=1)]
+    out["confidence"] = probs.max(axis=1)
+    prob_df = pd.DataFrame(probs, columns=[f"prob_{c}" for c in model.classes_])
+    return pd.concat([out, prob_df], axis=1)
+
+def predict_file(input_path: str, output_path: str, bundle: dict, chunksize: int = 100_000) -> int:
+    """Stream input_path through the classifier into output_path; returns the number of rows scored."""
+    writer = ChunkWriter(output_path)
+    n = 0
+    try:
+        for chunk in iter_chunks(input_path, chunksize):
+            writer.write(predict_chunk(chunk, bundle))
+            n += len(chunk)
+    finally:
+        writer.close()
+    return n
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Predict beverage category for every row of a nutrition file.")
+    parser.add_argument("input", help="CSV or Parquet file with Starbucks-style nutrition columns")
+    parser.add_argument("output", help="Output CSV or Parquet file")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--data", default=None, help="Training menu CSV (default: bundled dataset)")
+    parser.add_argument("--n-neighbors", type=int, default=None)
+    parser.add_argument("--weights", choices=["uniform", "distance"], default=None)
+    parser.add_argument("--metric", choices=["euclidean", "manhattan"], default=None)
+    args = parser.parse_args(argv)
+
+    bundle = load_classifier(args.data, args.n_neighbors, args.weights, args.metric)
+    n = predict_file(args.input, args.output, bundle, chunksize=args.chunksize)
+    print(f"Scored {n} rows -> {args.output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Batch PDF reports: one per segment plus a combined report.
+
+    python -m src.reports reports/ --by category --workers 4
+
+Aggregates are computed once in the parent; each worker process builds and writes
+one PDF with export_insights_pdf, so only one story is in memory per worker.
+Chart PNGs are cached on disk by a hash of the plotted data.
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.utils import PROJECT_ROOT, export_insights_pdf, find_data_file, load_menu
+
+CHART_CACHE_DIR = PROJECT_ROOT / "data" / ".cache" / "charts"
+SUGAR_LIMIT_G = 40
+
+# --- 1. Tổng hợp (tính một lần) ---
+def segment_aggregates(df: pd.DataFrame, by: str = "category") -> dict:
+    """{segment: {"kpis", "highlights", "chart"}} from a single groupby pass."""
+    g = df.groupby(by, observed=True, sort=True)
+    stats = pd.DataFrame({
+        "items": g.size(),
+        "avg_calories": g["calories"].mean(),
+        "avg_sugar": g["sugar_g"].mean(),
+        "max_caffeine": g["caffeine_mg"].max() if "caffeine_mg" in df.columns else 0.0,
+        "over_sugar": (df["sugar_g"] > SUGAR_LIMIT_G).groupby(df[by], observed=True).sum(),
+    })
+    heaviest = df.sort_values("calories", ascending=False).groupby(by, observed=True, sort=True).head(3)
+    lightest = df.sort_values("calories", ascending=True).groupby(by, observed=True, sort=True).head(3)
+
+    # Vị trí dòng của từng segment lấy từ chính groupby, không lọc lại df cho mỗi segment
+    positions = g.indices
+    heavy_by = dict(list(heaviest.groupby(by, observed=True, sort=False)))
+    light_by = dict(list(lightest.groupby(by, observed=True, sort=False)))
+    calories = df["calories"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    out = {}
+    for seg, row in stats.iterrows():
+        heavy, light = heavy_by[seg], light_by[seg]
+        chart = calories[positions[seg]]
+        out[seg] = {
+            "kpis": {
+                "Items": int(row["items"]),
+                "Avg. Calories": f"{row['avg_calories']:.0f} kcal",
+                "Avg. Sugar": f"{row['avg_sugar']:.1f} g",
+                "Max Caffeine": f"{row['max_caffeine']:.0f} mg",
+                f"Items over {SUGAR_LIMIT_G} g sugar": int(row["over_sugar"]),
+            },
+            "highlights": [f"Heaviest: {b} ({p}) - {c:.0f} kcal" for b, p, c in zip(heavy["beverage"], heavy["prep"], heavy["calories"])]
+                          + [f"Lightest: {b} ({p}) - {c:.0f} kcal" for b, p, c in zip(light["beverage"], light["prep"], light["calories"])],
+            "chart": chart[~np.isnan(chart)],
+        }
+    return out
+
+# --- 2. Biểu đồ (cache theo hash nội dung) ---
+def render_histogram(values, title: str, cache_dir=CHART_CACHE_DIR) -> str:
+    """PNG histogram of `values`; re-used from disk when the same data and title were rendered before."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    values = np.asarray(values, dtype=np.float64)
+    key = hashlib.sha1(values.tobytes() + title.encode()).hexdigest()[:20]
+    path = Path(cache_dir) / f"hist-{key}.png"
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fig, ax = plt.subplots(figsize=(7.3, 4.3))
+        ax.hist(values, bins=20, color="#00704A")
+        ax.set_title(title)
+        ax.set_xlabel("Calories (kcal)")
+        ax.set_ylabel("Items")
+        tmp = path.with_name(path.stem + f".{os.getpid()}.tmp.png")
+        fig.savefig(tmp, dpi=100, bbox_inches="tight")
+        plt.close(fig)
+        tmp.replace(path)
+    return str(path)
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(name)).strip("_").lower() or "segment"
+
+def segment_filenames(segments) -> dict:
+    """{segment: "<slug>.pdf"}, unique per segment and never "combined.pdf" ("_2", "_3"... on collision)."""
+    used, names = {"combined"}, {}
+    for seg in segments:
+        base = name = _slug(seg)
+        n = 2
+        while name in used:
+            name, n = f"{base}_{n}", n + 1
+        used.add(name)
+        names[seg] = f"{name}.pdf"
+    return names
+
+def _build_segment(path: str, segment: str, agg: dict, cache_dir: str) -> str:
+    chart = render_histogram(agg["chart"], f"Calorie distribution - {segment}", cache_dir)
+    return export_insights_pdf(path, agg["kpis"], agg["highlights"], images=[chart],
+                               title=f"Starbucks Nutrition Report - {segment}")
+
+def _build_combined(path: str, aggs: dict, all_calories, cache_dir: str) -> str:
+    header = ["Segment"] + list(next(iter(aggs.values()))["kpis"])
+    rows = [header] + [[seg] + [str(v) for v in agg["kpis"].values()] for seg, agg in aggs.items()]
+    chart = render_histogram(all_calories, "Calorie distribution - all segments", cache_dir)
+    kpis = {"Segments": len(aggs), "Items": sum(a["kpis"]["Items"] for a in aggs.values())}
+    return export_insights_pdf(path, kpis, [], images=[chart], tables=[rows],
+                               title="Starbucks Nutrition Report - All Segments")
+
+# --- 3. Pipeline ---
+def generate_reports(df: pd.DataFrame, out_dir: str, by: str = "category", max_workers: int = None,
+                     cache_dir=CHART_CACHE_DIR) -> list:
+    """Write one PDF per `by` segment plus combined.pdf into out_dir using a process pool; returns the paths."""
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    aggs = segment_aggregates(df, by=by)
+    filenames = segment_filenames(aggs)
+    cache_dir = str(cache_dir)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_build_segment, str(out / filenames[seg]), seg, agg, cache_dir)
+                   for seg, agg in aggs.items()]
+        futures.append(pool.submit(_build_combined, str(out / "combined.pdf"), aggs,
+                                   df["calories"].dropna().to_numpy(), cache_dir))
+        return [f.result() for f in futures]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate per-segment and combined PDF nutrition reports.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--by", default="category", help="Segment column (e.g. category, prep, health_tier)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--data", default=None, help="Menu CSV (default: bundled dataset)")
+    args = parser.parse_args(argv)
+
+    df = load_menu(args.data or find_data_file())
+    paths = generate_reports(df, args.out_dir, by=args.by, max_workers=args.workers)
+    print(f"Wrote {len(paths)} reports to {args.out_dir}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Local JSON scoring service for swaps, persona picks, goal filters and category prediction.
+
+    python -m src.service --port 8000
+
+Every endpoint accepts POST with a JSON body; "items" may hold a batch of requests.
+    GET  /health
+    POST /swap      {"items": [{"beverage": "...", "prep": "..."}], "by": ["category", "prep"]}
+    POST /personas  {"persona": "...", "k": 5}          (omit persona for all personas)
+    POST /filter    {"calories": 150, "sugar_g": 20, "limit": 50}
+    POST /predict   {"items": [{"calories": 200, "sugar_g": 30, ...}]}
+Malformed requests (items that are not objects, an unknown "by", a negative k, a /filter
+limit that is not a number or names an unindexed column) get 400, an unknown drink or
+persona 404 (batch entries carry "status": 404 instead), anything else 500.
+The menu, indexes and KNN model are loaded once at start-up; requests run on a thread pool.
+"""
+import argparse
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from src.predict import load_classifier, predict_chunk
+from src.utils import (PERSONAS, NutrientRangeIndex, SwapIndex, find_data_file, load_menu,
+                       persona_scores, persona_top_k)
+
+RECORD_COLS = ["beverage", "prep", "category", "calories", "sugar_g", "fat_g", "caffeine_mg", "health_tier"]
+
+def _records(df: pd.DataFrame) -> list:
+    cols = [c for c in RECORD_COLS if c in df.columns]
+    out = df[cols].astype(object)
+    return out.where(out.notna(), None).to_dict("records")
+
+def _json_default(o):
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+def _limit_value(col: str, value) -> float:
+    """A "<= X" limit as a finite float ("150" -> 150.0); ValueError otherwise."""
+    try:
+        if isinstance(value, bool):
+            raise TypeError
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"limit for {col!r} must be a number, got {value!r}") from None
+    if not np.isfinite(value):
+        raise ValueError(f"limit for {col!r} must be finite")
+    return value
+
+def _check_items(items):
+    """`items` must be absent or a list of JSON objects."""
+    if items is None:
+        return None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError('"items" must be a list of objects')
+    return items
+
+# --- 1. Trạng thái dùng chung (load một lần) ---
+class ScoringService:
+    """Warm menu, indexes and model shared by all request threads (read-only after __init__)."""
+
+    def __init__(self, data_path: str = None, load_model: bool = True):
+        self.menu = load_menu(data_path or find_data_file())
+        self.swap_indexes = {
+            ("category", "prep"): SwapIndex(self.menu, by=("category", "prep")),
+            ("category",): SwapIndex(self.menu, by=("category",)),
+        }
+        self.range_index = NutrientRangeIndex(self.menu)
+        self.persona_scores = persona_scores(self.menu, index=self.range_index)
+        self.classifier = load_classifier(data_path) if load_model else None
+        # (beverage, prep) -> vị trí dòng đầu tiên
+        keys = list(zip(self.menu["beverage"], self.menu["prep"]))
+        self.positions = {}
+        for pos, key in enumerate(keys):
+            self.positions.setdefault(key, pos)
+
+    def swap_index(self, by=("category", "prep")) -> SwapIndex:
+        key = (by,) if isinstance(by, str) else tuple(by)
+        if key not in self.swap_indexes:
+            raise ValueError(f"unknown by {by!r}; expected one of {[list(k) for k in self.swap_indexes]}")
+        return self.swap_indexes[key]
+
+    def swap(self, item: dict, by=("category", "prep")) -> dict:
+        index = self.swap_index(by)
+        pos = self.positions.get((item.get("beverage"), item.get("prep")))
+        if pos is None:
+            return {"error": "unknown drink", "query": item}
+        row = self.menu.iloc[pos]
+        swap = index.lookup(row)
+        result = {"original": _records(self.menu.iloc[[pos]])[0], "swap": None}
+        if not swap.empty:
+            result["swap"] = _records(swap)[0]
+            result["calories_saved"] = float(row["calories"] - swap["calories"].iloc[0])
+            result["sugar_saved"] = float(row["sugar_g"] - swap["sugar_g"].iloc[0])
+        return result
+
+    def personas(self, persona: str = None, k: int = 5) -> dict:
+        tops = persona_top_k(self.menu, k=k, scores=self.persona_scores)
+        if persona is not None:
+            if persona not in tops:
+                return {"error": "unknown persona", "personas": list(PERSONAS)}
+            tops = {persona: tops[persona]}
+        return {name: _records(top) for name, top in tops.items()}
+
+    def filter(self, limits: dict, limit: int = 50) -> dict:
+        unknown = [c for c in limits if c not in self.range_index.columns]
+        if unknown:
+            raise ValueError(f"unknown filter column(s) {unknown}; expected some of {self.range_index.columns}")
+        if limit < 0:
+            raise ValueError('"limit" must be >= 0')
+        pos = self.range_index.positions(**{c: _limit_value(c, v) for c, v in limits.items()})
+        return {"count": int(len(pos)), "items": _records(self.menu.iloc[pos[:limit]])}
+
+    def predict(self, items: list) -> list:
+        if self.classifier is None:
+            return [{"error": "model not loaded"}]
+        out = predict_chunk(pd.DataFrame(items), self.classifier, keep_cols=())
+        return [{"predicted_category": p, "confidence": float(c)}
+                for p, c in zip(out["predicted_category"], out["confidence"])]
+
+    def handle(self, path: str, body: dict):
+        """Dispatch one request; returns (status, payload)."""
+        items = _check_items(body.get("items"))
+        if path == "/health":
+            return 200, {"status": "ok", "rows": len(self.menu)}
+        if path == "/swap":
+            by = body.get("by", ["category", "prep"])
+            if items is not None:
+                results = [self.swap(item, by) for item in items]
+                return 200, [{**r, "status": 404} if "error" in r else r for r in results]
+            result = self.swap(body, by)
+            return (404 if "error" in result else 200), result
+        if path == "/personas":
+            k = int(body.get("k", 5))
+            if k < 0:
+                raise ValueError('"k" must be >= 0')
+            result = self.personas(body.get("persona"), k)
+            return (404 if "error" in result else 200), result
+        if path == "/filter":
+            batch = items if items is not None else [body]
+            results = [self.filter({c: v for c, v in q.items() if c != "limit"}, int(q.get("limit", 50))) for q in batch]
+            return 200, results if items is not None else results[0]
+        if path == "/predict":
+            return 200, self.predict(items if items is not None else [body])
+        return 404, {"error": f"unknown endpoint {path}"}
+
+# --- 2. HTTP ---
+def make_handler(service: ScoringService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload):
+            data = json.dumps(payload, default=_json_default).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, body: dict):
+            try:
+                status, payload = service.handle(self.path.split("?")[0], body)
+            except (KeyError, TypeError, ValueError) as e:
+                status, payload = 400, {"error": str(e)}
+            except Exception as e:
+                # Lỗi ngoài dự kiến vẫn trả JSON thay vì làm chết thread xử lý
+                status, payload = 500, {"error": f"internal error: {type(e).__name__}: {e}"}
+            self._send(status, payload)
+
+        def do_GET(self):
+            self._dispatch({})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as e:
+                return self._send(400, {"error": f"invalid JSON: {e}"})
+            if not isinstance(body, dict):
+                return self._send(400, {"error": "body must be a JSON object"})
+            self._dispatch(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Local JSON scoring service for the Starbucks menu.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--data", default=None, help="Menu CSV (default: bundled dataset)")
+    args = parser.parse_args(argv)
+
+    service = ScoringService(args.data)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving on http://{args.host}:{args.port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""
+Lightweight timing spans for the utils hot paths and the page sections.
+
+    @timed()                         # every call of the function becomes a span
+    def load_menu(...): ...
+
+    begin_rerun("1_EDA")             # top of a page
+    section("1_EDA/panorama")        # flat page code: runs until the next section / end_rerun
+    with t1, span("1_EDA/structure"):
+        ...
+    end_rerun(); dev_panel()         # bottom of a page
+
+Spans go into a ring buffer (last SPAN_BUFFER spans) and into running per-name
+totals. Env vars:
+    MENU_INSTRUMENT=0        disable entirely (decorators return the plain function)
+    MENU_METRICS_FILE=path   dump after each rerun (at most every METRICS_INTERVAL_S);
+                             "*.prom" -> Prometheus text, anything else -> JSON
+    MENU_DEV_PANEL=1         show the timing panel in the sidebar (also ?dev=1)
+"""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+ENABLED = os.environ.get("MENU_INSTRUMENT", "1") != "0"
+METRICS_FILE = os.environ.get("MENU_METRICS_FILE") or None
+DEV_PANEL = os.environ.get("MENU_DEV_PANEL", "") not in ("", "0")
+SPAN_BUFFER = 4096
+METRICS_INTERVAL_S = 5.0
+
+# (rerun_id, name, start, duration_s, depth)
+SPANS = deque(maxlen=SPAN_BUFFER)
+_totals = {}  # name -> [calls, total_s, max_s]
+_lock = threading.Lock()
+_rerun_ids = itertools.count(1)
+_last_dump = 0.0
+
+class _Rerun:
+    __slots__ = ("id", "page", "start", "section", "section_start")
+
+    def __init__(self, page: str):
+        self.id = next(_rerun_ids)
+        self.page = page
+        self.start = time.perf_counter()
+        self.section = None
+        self.section_start = 0.0
+
+_current = contextvars.ContextVar("menu_rerun", default=None)
+_depth = contextvars.ContextVar("menu_span_depth", default=0)
+
+def _record(name: str, start: float, duration: float, depth: int):
+    rerun = _current.get()
+    SPANS.append((rerun.id if rerun else None, name, start, duration, depth))
+    with _lock:
+        t = _totals.get(name)
+        if t is None:
+            _totals[name] = [1, duration, duration]
+        else:
+            t[0] += 1
+            t[1] += duration
+            if duration > t[2]:
+                t[2] = duration
+
+# --- 1. Decorator / context manager ---
+def timed(name=None):
+    """Record every call of the decorated function as a span (default name: its qualname)."""
+    def decorator(fn):
+        if not ENABLED:
+            return fn
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            depth = _depth.get()
+            token = _depth.set(depth + 1)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(label, start, time.perf_counter() - start, depth)
+                _depth.reset(token)
+        return wrapper
+
+    if callable(name):  # dùng được cả @timed lẫn @timed()
+        fn, name = name, None
+        return decorator(fn)
+    return decorator
+
+@contextmanager
+def span(name: str):
+    """Record the body of a with-block as a span."""
+    if not ENABLED:
+        yield
+        return
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, start, time.perf_counter() - start, depth)
+        _depth.reset(token)
+
+# --- 2. Rerun / section của trang ---
+def _close_section(rerun: _Rerun):
+    if rerun.section is not None:
+        _record(rerun.section, rerun.section_start, time.perf_counter() - rerun.section_start, 0)
+        rerun.section = None
+        _depth.set(0)
+
+def begin_rerun(page: str):
+    """Start collecting spans for one script run of `page`."""
+    if not ENABLED:
+        return
+    previous = _current.get()
+    if previous is not None:
+        # Lần chạy trước dừng giữa chừng (st.stop / exception)
+        _close_section(previous)
+    _current.set(_Rerun(page))
+
+def section(name: str):
+    """Close the open page section (if any) and start `name`."""
+    rerun = _current.get() if ENABLED else None
+    if rerun is None:
+        return
+    _close_section(rerun)
+    rerun.section, rerun.section_start = name, time.perf_counter()
+    # Span bên trong section nằm ở depth 1
+    _depth.set(1)
+
+def end_rerun():
+    """Close the open section, record the whole rerun and write MENU_METRICS_FILE if due."""
+    global _last_dump
+    rerun = _current.get() if ENABLED else None
+    if rerun is None:
+        return
+    _close_section(rerun)
+    _record(f"{rerun.page}/rerun", rerun.start, time.perf_counter() - rerun.start, 0)
+    if METRICS_FILE and time.monotonic() - _last_dump >= METRICS_INTERVAL_S:
+        _last_dump = time.monotonic()
+        try:
+            dump(METRICS_FILE)
+        except OSError:
+            pass
+
+# --- 3. Đọc / xuất ---
+def rerun_spans(rerun_id: int = None) -> list:
+    """Spans of one rerun (default: the current one), in start order."""
+    if rerun_id is None:
+        rerun = _current.get()
+        rerun_id = rerun.id if rerun else None
+    if rerun_id is None:
+        return []
+    rows = [s for s in list(SPANS) if s[0] == rerun_id]
+    return sorted(rows, key=lambda s: s[2])
+
+def totals() -> dict:
+    """{name: {"calls", "total_s", "mean_s", "max_s"}} since process start."""
+    with _lock:
+        items = [(name, list(t)) for name, t in _totals.items()]
+    return {name: {"calls": n, "total_s": total, "mean_s": total / n, "max_s": peak}
+            for name, (n, total, peak) in items}
+
+def _prom_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def prometheus_text() -> str:
+    stats = totals()
+    lines = []
+    for metric, kind, key, help_text in [
+        ("menu_span_calls_total", "counter", "calls", "Number of completed spans."),
+        ("menu_span_seconds_total", "counter", "total_s", "Wall time spent in spans."),
+        ("menu_span_max_seconds", "gauge", "max_s", "Slowest single span."),
+    ]:
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+        lines += [f'{metric}{{span="{_prom_label(name)}"}} {s[key]:.9g}' for name, s in sorted(stats.items())]
+    return "\n".join(lines) + "\n"
+
+def dump(path, recent: int = 500) -> Path:
+    """Write totals (+ the last `recent` spans for JSON) atomically; .prom -> Prometheus text."""
+    path = Path(path)
+    if path.suffix == ".prom":
+        text = prometheus_text()
+    else:
+        spans = [{"rerun": r, "name": n, "start": s, "duration_s": d, "depth": depth}
+                 for r, n, s, d, depth in list(SPANS)[-recent:]]
+        text = json.dumps({"generated": time.time(), "totals": totals(), "recent": spans}, indent=2)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+# --- 4. Panel trong sidebar ---
+def dev_panel():
+    """Sidebar table of this rerun's spans and the slowest spans overall (MENU_DEV_PANEL or ?dev=1)."""
+    if not ENABLED:
+        return
+    import pandas as pd
+    import streamlit as st
+
+    if not DEV_PANEL and st.query_params.get("dev") != "1":
+        return
+    rows = rerun_spans()
+    with st.sidebar.expander("⏱️ Developer: timings", expanded=False):
+        if rows:
+            origin = rows[0][2]
+            st.dataframe(pd.DataFrame({
+                "span": ["· " * depth + name for _, name, _, _, depth in rows],
+                "start_ms": [(start - origin) * 1000 for _, _, start, _, _ in rows],
+                "ms": [duration * 1000 for _, _, _, duration, _ in rows],
+            }).round(2), hide_index=True, use_container_width=True)
+        stats = pd.DataFrame.from_dict(totals(), orient="index")
+        if not stats.empty:
+            st.caption("Slowest spans since process start")
+            st.dataframe((stats.sort_values("total_s", ascending=False).head(15) * [1, 1000, 1000, 1000])
+                         .rename(columns={"total_s": "total_ms", "mean_s": "mean_ms", "max_s": "max_ms"}).round(2),
+                         use_container_width=True)
@@ -1,14 +1,56 @@
+import functools
+import hashlib
+import importlib
+import logging
+import os
+import re
+import types
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.pagesizes import A4
+
+from src.telemetry import timed
+
+logger = logging.getLogger(__name__)
+
+# --- 0. Lazy imports ---
+class _LazyModule(types.ModuleType):
+    """Placeholder that imports the real module on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_name"] = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__dict__["_lazy_name"])
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+def lazy_import(name: str) -> types.ModuleType:
+    """
+    Module-level lazy loader: `plt = lazy_import("matplotlib.pyplot")` costs nothing until
+    `plt.<something>` is used. Heavy optional modules (scikit-learn, ReportLab, plotting)
+    go through this so page cold starts only pay for what they render.
+    """
+    return _LazyModule(name)
+
+_sk_neighbors = lazy_import("sklearn.neighbors")
+_sk_preprocessing = lazy_import("sklearn.preprocessing")
+_rl_platypus = lazy_import("reportlab.platypus")
+_rl_styles = lazy_import("reportlab.lib.styles")
+_rl_pagesizes = lazy_import("reportlab.lib.pagesizes")
 
 # --- 1. Các hàm xử lý dữ liệu cơ bản ---
-def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
-    df.columns = (
-        df.columns.str.strip()
+DATA_FILE = "Nutrition_facts_for_Starbucks_Menu_1604_26.csv"
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+DV_COLUMNS = ["vitamin_a_dv", "vitamin_c_dv", "calcium_dv", "iron_dv"]
+
+@timed()
+def normalize_names(columns) -> list:
+    """Raw CSV headers -> the snake_case names used across the app (category, sugar_g, ...)."""
+    cleaned = (
+        pd.Index(columns).astype(str).str.strip()
         .str.replace(r"[^\w]+", "_", regex=True)
         .str.replace(r"_+", "_", regex=True)
         .str.strip("_")
@@ -35,64 +77,983 @@ def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
         "Calcium___DV_": "calcium_dv",
         "Iron___DV_": "iron_dv",
         "Caffeine__mg_": "caffeine_mg",
+        # Header thật của CSV ("Total.Fat..g.") sau khi chuẩn hóa thành "Total_Fat_g"
+        "Total_Carbohydrates_g": "carbs_g",
+        "Total_Fat_g": "fat_g",
+        "Saturated_Fat_g": "sat_fat_g",
+        "Trans_Fat_g": "trans_fat_g",
+        "Protein_g": "protein_g",
+        "Sodium_mg": "sodium_mg",
+        "Cholesterol_mg": "cholesterol_mg",
+        "Dietary_Fibre_g": "fiber_g",
+        "Vitamin_A_DV": "vitamin_a_dv",
+        "Vitamin_C_DV": "vitamin_c_dv",
+        "Calcium_DV": "calcium_dv",
+        "Iron_DV": "iron_dv",
+        "Caffeine_mg": "caffeine_mg",
         "Unnamed_0": "row_id"
     }
-    df = df.rename(columns={k:v for k,v in rename_map.items() if k in df.columns})
+    return [rename_map.get(c, c) for c in cleaned]
+
+@timed()
+def coerce_numeric(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse nutrient columns (already renamed) to numbers in place; "%" DV strings lose the "%"."""
     for c in ["calories","sugar_g","carbs_g","fat_g","sat_fat_g","trans_fat_g","protein_g","sodium_mg","cholesterol_mg","fiber_g","caffeine_mg"]:
         if c in df.columns:
             df[c] = pd.to_numeric(df[c], errors="coerce")
+    for c in DV_COLUMNS:
+        if c in df.columns and not pd.api.types.is_numeric_dtype(df[c]):
+            df[c] = pd.to_numeric(df[c].astype(str).str.rstrip("%"), errors="coerce")
+    return df
+
+@timed()
+def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    df.columns = normalize_names(df.columns)
+    return coerce_numeric(df)
+
+# Tăng số này mỗi khi normalize_columns thay đổi để bỏ qua các snapshot cũ
+CACHE_SCHEMA_VERSION = 2
+
+@timed()
+def file_fingerprint(path: str) -> str:
+    """SHA-1 of the file contents, used to key the binary cache."""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _cache_path(path: str, fingerprint: str) -> Path:
+    src = Path(path)
+    return src.parent / ".cache" / f"{src.stem}.{fingerprint[:16]}.v{CACHE_SCHEMA_VERSION}.parquet"
+
+def _read_menu_csv(path: str) -> pd.DataFrame:
+    """
+    read_csv (whole-file type inference, so a column is not split into int and str
+    chunks) + normalize_columns; columns that still mix types become "string" so the
+    frame can always be written to Parquet.
+    """
+    df = normalize_columns(pd.read_csv(path, low_memory=False))
+    mixed = [c for c in df.columns if df[c].dtype == object
+             and pd.api.types.infer_dtype(df[c], skipna=True).startswith("mixed")]
+    return df.astype({c: "string" for c in mixed}) if mixed else df
+
+def _write_cache(df: pd.DataFrame, cache: Path, stem: str):
+    """Write the Parquet snapshot atomically and drop stale snapshots of the same CSV (`stem`)."""
+    tmp = cache.with_name(cache.name + f".{os.getpid()}.tmp")
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, cache)
+        # Khớp đúng "<stem>.<16 hex>.v<N>.parquet": menu.csv và menu.2024.csv không xóa snapshot của nhau
+        own = re.compile(re.escape(stem) + r"\.[0-9a-f]{16}\.v\d+\.parquet")
+        for old in cache.parent.glob("*.parquet"):
+            if old != cache and own.fullmatch(old.name):
+                old.unlink(missing_ok=True)
+    except (OSError, ImportError, ValueError) as e:
+        # Read-only filesystem, thiếu pyarrow, kiểu cột không ghi được -> bỏ qua cache nhưng có log
+        logger.warning("Parquet snapshot %s not written, every load will re-parse the CSV: %s: %s",
+                       cache.name, type(e).__name__, e)
+        try:
+            tmp.unlink(missing_ok=True)
+        except OSError:
+            pass
+
+@timed()
+def load_data(path: str, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Load and normalize the menu CSV.
+    With use_cache, a typed Parquet snapshot keyed by the file hash and
+    CACHE_SCHEMA_VERSION is kept in `<csv dir>/.cache/` so later cold starts
+    skip CSV parsing and normalization entirely.
+    """
+    if not use_cache:
+        return _read_menu_csv(path)
+
+    fingerprint = file_fingerprint(path)
+    cache = _cache_path(path, fingerprint)
+    df = None
+    if cache.exists():
+        try:
+            df = pd.read_parquet(cache, memory_map=True)
+        except (OSError, ImportError, ValueError):
+            df = None
+    if df is None:
+        df = _read_menu_csv(path)
+        _write_cache(df, cache, Path(path).stem)
+    df.attrs["fingerprint"] = fingerprint
+    return df
+
+@timed()
+def find_data_file():
+    """Locate the menu CSV in data/ or the project root (also accepts the '(1)' download name)."""
+    stem = DATA_FILE[:-len(".csv")]
+    for base in [PROJECT_ROOT / "data", PROJECT_ROOT, Path("data"), Path(".")]:
+        for name in [DATA_FILE, f"{stem} (1).csv"]:
+            if (base / name).exists():
+                return str(base / name)
+    return None
+
+# --- Feature engineering (khai báo một lần, chạy một lượt trên toàn bộ frame) ---
+# Ngưỡng health tier, xét từ trên xuống: dòng đầu tiên có calories > cal hoặc sugar_g > sugar sẽ được chọn
+HEALTH_TIERS = [
+    # (label, calories >, sugar_g >)
+    ("🔴 Indulgent", 350, 45),
+    ("🟡 Moderate", 180, 20),
+]
+DEFAULT_HEALTH_TIER = "🟢 Optimized"
+
+# name -> fn(df, arrays) ; arrays: các cột số dạng float64 liền mạch, NaN đã thay bằng 0
+FEATURES = {}
+
+def register_feature(name: str):
+    """Register a derived column computed by add_features."""
+    def decorator(fn):
+        FEATURES[name] = fn
+        return fn
+    return decorator
+
+@register_feature("health_tier")
+def _health_tier(df, arrays):
+    conditions = [(arrays["calories"] > cal) | (arrays["sugar_g"] > sugar) for _, cal, sugar in HEALTH_TIERS]
+    labels = np.array([label for label, _, _ in HEALTH_TIERS] + [DEFAULT_HEALTH_TIER], dtype=object)
+    # np.select trên chỉ số nhãn để tránh so sánh chuỗi
+    idx = np.select(conditions, np.arange(len(HEALTH_TIERS)), default=len(HEALTH_TIERS))
+    return labels[idx]
+
+@register_feature("efficiency_index")
+def _efficiency_index(df, arrays):
+    return arrays["caffeine_mg"] / (arrays["calories"] + 1)
+
+@register_feature("nutrient_score")
+def _nutrient_score(df, arrays):
+    dv = [arrays[c] for c in DV_COLUMNS if c in arrays]
+    return np.column_stack(dv).sum(axis=1) if dv else np.zeros(len(df))
+
+@register_feature("full_name")
+def _full_name(df, arrays):
+    if "beverage" not in df.columns or "prep" not in df.columns:
+        return None
+    return df["beverage"].astype(str) + " (" + df["prep"].astype(str) + ")"
+
+def _feature_arrays(df: pd.DataFrame) -> dict:
+    arrays = {}
+    for c in ["calories", "sugar_g", "caffeine_mg"] + DV_COLUMNS:
+        if c in df.columns:
+            arrays[c] = np.nan_to_num(df[c].to_numpy(dtype=np.float64, na_value=np.nan), nan=0.0)
+        elif c not in DV_COLUMNS:
+            arrays[c] = np.zeros(len(df))
+    return arrays
+
+@timed()
+def add_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Add every registered feature (health_tier, efficiency_index, nutrient_score, full_name) in one pass."""
+    arrays = _feature_arrays(df)
+    new_cols = {}
+    for name, fn in FEATURES.items():
+        values = fn(df, arrays)
+        if values is not None:
+            new_cols[name] = values
+    return df.assign(**new_cols)
+
+@timed()
+def load_menu(path: str, use_cache: bool = True, compact: bool = False) -> pd.DataFrame:
+    """load_data + add_features: the dataset every page works on (compact_frame'd if `compact`)."""
+    df = load_data(path, use_cache=use_cache)
+    fingerprint = df.attrs.get("fingerprint")
+    df = add_features(df)
+    if compact:
+        df = compact_frame(df)
+    if fingerprint:
+        df.attrs["fingerprint"] = fingerprint
     return df
 
-def load_data(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
-    return normalize_columns(df)
+# --- Chế độ compact (opt-in): categorical + số nhỏ gọn ---
+# Cột chữ lặp lại nhiều -> categorical; bảng categories chính là bảng tên dùng chung
+COMPACT_CATEGORICAL = ["category", "beverage", "prep", "health_tier", "full_name"]
+
+def _compact_numeric(s: pd.Series) -> np.ndarray:
+    """int16 (or int32) for whole numbers without NaN, float32 otherwise."""
+    values = s.to_numpy(dtype=np.float64, na_value=np.nan)
+    if len(values) and not np.isnan(values).any() and np.array_equal(values, np.round(values)):
+        peak = np.abs(values).max()
+        for dtype in (np.int16, np.int32):
+            if peak <= np.iinfo(dtype).max:
+                return values.astype(dtype)
+    return values.astype(np.float32)
 
-def goal_filter(df: pd.DataFrame, under_cal=None, under_sugar=None, under_fat=None) -> pd.DataFrame:
-    out = df.copy()
-    if under_cal is not None and "calories" in out: out = out[out["calories"] <= under_cal]
-    if under_sugar is not None and "sugar_g" in out: out = out[out["sugar_g"] <= under_sugar]
-    if under_fat is not None and "fat_g" in out: out = out[out["fat_g"] <= under_fat]
+@timed()
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Memory-lean copy of the menu: COMPACT_CATEGORICAL columns become categoricals,
+    numeric columns become int16/int32 (whole numbers) or float32.
+    Group with observed=True on the categorical columns.
+    """
+    cols = {}
+    for c in df.columns:
+        if c in COMPACT_CATEGORICAL:
+            cols[c] = df[c].astype("category")
+        elif pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c]):
+            cols[c] = _compact_numeric(df[c])
+    out = df.assign(**cols)
+    out.attrs = dict(df.attrs)
     return out
 
-def healthier_alternative(df: pd.DataFrame, row, by=["category","prep"], sort_by=["calories","sugar_g"]):
-    """Find a similar but lighter option in same (category, prep) if possible; else same category; else global."""
-    df = df.copy()
-    subset = df.copy()
-    for col in by:
-        if col in df.columns and col in row and pd.notna(row[col]):
-            subset = subset[subset[col] == row[col]]
-    if subset.empty and "category" in df.columns and "category" in row:
-        subset = df[df["category"] == row["category"]]
-    if subset.empty:
-        subset = df
-    for sb in sort_by:
-        if sb in subset.columns:
-            subset = subset.sort_values(sb, ascending=True)
-    # Prefer items with lower calories & sugar than original
-    if "calories" in subset.columns and "calories" in row and "sugar_g" in subset.columns and "sugar_g" in row:
-        subset = subset[(subset["calories"] <= row["calories"]) & (subset["sugar_g"] <= row["sugar_g"])]
-    # remove self by beverage name+prep if exists
-    if "beverage" in subset.columns and "beverage" in row:
-        subset = subset[subset["beverage"] != row["beverage"]]
-    return subset.head(1)
+@timed()
+def memory_footprint(df: pd.DataFrame) -> pd.Series:
+    """Deep memory usage in bytes per column (index excluded)."""
+    return df.memory_usage(deep=True, index=False)
+
+@timed()
+def footprint_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Per-column dtype and bytes before/after compact_frame, with a TOTAL row."""
+    report = pd.DataFrame({
+        "dtype_before": before.dtypes.astype(str),
+        "dtype_after": after.dtypes.reindex(before.columns).astype(str),
+        "bytes_before": memory_footprint(before),
+        "bytes_after": memory_footprint(after).reindex(before.columns),
+    })
+    report.loc["TOTAL"] = ["", "", report["bytes_before"].sum(), report["bytes_after"].sum()]
+    report["ratio"] = report["bytes_after"] / report["bytes_before"]
+    return report
+
+class NutrientRangeIndex:
+    """
+    Index for "column <= X" constraints.
+    Each numeric column keeps its sorted values and the matching row-position permutation,
+    so a constraint is one searchsorted; a multi-column query starts from the most selective
+    column and only checks the remaining limits on those few rows.
+    """
+
+    @timed("NutrientRangeIndex.build")
+    def __init__(self, df: pd.DataFrame, columns=None):
+        self.df = df
+        self.columns = [c for c in (columns or numeric_columns(df)) if c in df.columns]
+        self._values, self._sorted, self._perm = {}, {}, {}
+        for c in self.columns:
+            vals = df[c].to_numpy(dtype=np.float64, na_value=np.nan)
+            order = np.argsort(vals, kind="stable")
+            order = order[~np.isnan(vals[order])]
+            self._values[c], self._sorted[c], self._perm[c] = vals, vals[order], order
+
+    @timed()
+    def positions(self, **limits) -> np.ndarray:
+        """
+        Sorted row positions satisfying column <= limit for every given column (None = no limit).
+        Columns of the frame that are not indexed are checked on the candidate rows;
+        a column the frame does not have raises KeyError.
+        """
+        limits = {c: v for c, v in limits.items() if v is not None}
+        unknown = [c for c in limits if c not in self.df.columns]
+        if unknown:
+            raise KeyError(f"no such column(s): {unknown}")
+        indexed = {c: v for c, v in limits.items() if c in self._sorted}
+        if indexed:
+            counts = {c: np.searchsorted(self._sorted[c], v, side="right") for c, v in indexed.items()}
+            first = min(counts, key=counts.get)
+            ids = self._perm[first][:counts[first]]
+            for c, v in indexed.items():
+                if c != first:
+                    ids = ids[self._values[c][ids] <= v]
+            ids = np.sort(ids)
+        else:
+            ids = np.arange(len(self.df))
+        # Cột không có trong index: lọc trên các dòng ứng viên còn lại
+        for c, v in limits.items():
+            if c not in indexed:
+                ids = ids[self.df[c].to_numpy(dtype=np.float64, na_value=np.nan)[ids] <= v]
+        return ids
+
+    @timed()
+    def query(self, **limits) -> pd.DataFrame:
+        return self.df.iloc[self.positions(**limits)]
+
+@timed()
+def goal_filter(df: pd.DataFrame, under_cal=None, under_sugar=None, under_fat=None, index: NutrientRangeIndex = None) -> pd.DataFrame:
+    """Rows under every given limit. Pass a prebuilt NutrientRangeIndex to avoid scanning the frame."""
+    # Cột không có trong frame bị bỏ qua ở cả hai nhánh (scan và index)
+    limits = {c: v for c, v in {"calories": under_cal, "sugar_g": under_sugar, "fat_g": under_fat}.items() if c in df}
+    if index is not None:
+        return index.query(**limits)
+    mask = np.ones(len(df), dtype=bool)
+    for col, limit in limits.items():
+        if limit is not None and col in df:
+            mask &= (df[col] <= limit).to_numpy()
+    return df[mask]
+
+class MembershipIndex:
+    """
+    Categorical encoding layer for filter columns (category, prep, health_tier, beverage).
+    Every column is stored as small integer codes; the low-cardinality ones also get one
+    packed bitset per level, so mask(category=[...], health_tier=[...]) is an OR of level
+    bitsets inside a column and an AND across columns, with no string comparisons.
+    High-cardinality columns (beverage) are answered from the codes with np.isin, since
+    a bitset per level would cost levels x rows / 8 bytes.
+    """
+
+    @timed("MembershipIndex.build")
+    def __init__(self, df: pd.DataFrame, columns=("category", "prep", "health_tier", "beverage"),
+                 bitset_columns=("category", "prep", "health_tier"), max_bitset_levels: int = 256):
+        self.df = df
+        self.n = len(df)
+        self.codes, self.levels, self.bits = {}, {}, {}
+        for c in columns:
+            if c not in df.columns:
+                continue
+            codes, levels = pd.factorize(df[c])
+            dtype = np.int8 if len(levels) < 127 else np.int16 if len(levels) < 32767 else np.int32
+            self.codes[c] = codes.astype(dtype)
+            self.levels[c] = pd.Index(levels)
+            if c in bitset_columns and len(levels) <= max_bitset_levels:
+                self.bits[c] = np.stack([np.packbits(codes == i) for i in range(len(levels))]) if len(levels) \
+                    else np.zeros((0, (self.n + 7) // 8), dtype=np.uint8)
+
+    def _column_bits(self, col: str, values) -> np.ndarray:
+        if isinstance(values, str) or not hasattr(values, "__iter__"):
+            values = [values]
+        lv = self.levels[col].get_indexer(list(values))
+        lv = lv[lv >= 0]
+        if col not in self.bits:
+            # Cột nhiều level: so khớp trên codes rồi mới pack
+            return np.packbits(np.isin(self.codes[col], lv))
+        if lv.size == 0:
+            return np.zeros(self.bits[col].shape[1], dtype=np.uint8)
+        return np.bitwise_or.reduce(self.bits[col][lv], axis=0)
+
+    @timed()
+    def mask(self, **filters) -> np.ndarray:
+        """Boolean row mask; a None filter is ignored, an empty list matches nothing (like isin([]))."""
+        acc = None
+        for col, values in filters.items():
+            if values is None or col not in self.codes:
+                continue
+            col_bits = self._column_bits(col, values)
+            acc = col_bits if acc is None else acc & col_bits
+        if acc is None:
+            return np.ones(self.n, dtype=bool)
+        return np.unpackbits(acc, count=self.n).astype(bool)
 
+    @timed()
+    def positions(self, **filters) -> np.ndarray:
+        return np.flatnonzero(self.mask(**filters))
+
+    @timed()
+    def select(self, **filters) -> pd.DataFrame:
+        return self.df[self.mask(**filters)]
+
+class SwapIndex:
+    """
+    Prebuilt lookup behind healthier_alternative.
+    Rows are grouped by every prefix of `by` ((category, prep) -> (category,) -> whole menu)
+    and each group keeps its row positions sorted by `sort_by`. A lookup is a binary search
+    on the first sort key plus a scan of that prefix for the first row that is no worse on
+    every sort key and is a different beverage.
+    """
+
+    @timed("SwapIndex.build")
+    def __init__(self, df: pd.DataFrame, by=("category", "prep"), sort_by=("calories", "sugar_g")):
+        self.df = df
+        self.by = [c for c in by if c in df.columns]
+        self.sort_by = [c for c in sort_by if c in df.columns]
+        n = len(df)
+        if self.sort_by:
+            self._keys = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in self.sort_by])
+        else:
+            self._keys = np.zeros((n, 1))
+        # Sắp xếp theo sort_by (khóa đầu tiên là chính), bỏ các dòng thiếu giá trị
+        order = np.lexsort(self._keys.T[::-1])
+        order = order[~np.isnan(self._keys[order]).any(axis=1)]
+
+        if "beverage" in df.columns:
+            codes, names = pd.factorize(df["beverage"])
+            self._bev = codes
+            self._bev_lookup = {name: i for i, name in enumerate(names)}
+        else:
+            self._bev, self._bev_lookup = None, {}
+
+        # levels[i] = (cột nhóm, {key: vị trí dòng đã sắp xếp})
+        self._levels = []
+        ordered = df.iloc[order]
+        for depth in range(len(self.by), -1, -1):
+            cols = self.by[:depth]
+            if cols:
+                groups = {key: order[idx] for key, idx in ordered.groupby(cols, observed=True, sort=False).indices.items()}
+            else:
+                groups = {(): order}
+            self._levels.append((cols, groups))
+
+    def _group_key(self, row, cols):
+        if not cols:
+            return ()
+        values = []
+        for c in cols:
+            if c not in row or pd.isna(row[c]):
+                return None
+            values.append(row[c])
+        return tuple(values) if len(values) > 1 else values[0]
+
+    @timed()
+    def lookup_position(self, row, fallback: bool = True, strict: bool = False):
+        """Row position of the best swap for `row`, or None. strict=True requires a lower first sort key."""
+        if any(c not in row or pd.isna(row[c]) for c in self.sort_by):
+            return None
+        target = np.array([float(row[c]) for c in self.sort_by]) if self.sort_by else np.zeros(1)
+        bev_code = self._bev_lookup.get(row["beverage"], -1) if self._bev is not None and "beverage" in row else -1
+
+        levels = self._levels if fallback else self._levels[:1]
+        for cols, groups in levels:
+            key = self._group_key(row, cols)
+            if key is None or key not in groups:
+                continue
+            positions = groups[key]
+            first = self._keys[positions, 0]
+            hi = np.searchsorted(first, target[0], side="left" if strict else "right")
+            cand = positions[:hi]
+            mask = (self._keys[cand] <= target).all(axis=1)
+            if self._bev is not None and bev_code >= 0:
+                mask &= self._bev[cand] != bev_code
+            hit = np.flatnonzero(mask)
+            if hit.size:
+                return int(cand[hit[0]])
+        return None
+
+    @timed()
+    def lookup(self, row, fallback: bool = True, strict: bool = False) -> pd.DataFrame:
+        """Best swap for `row` as a one-row DataFrame (empty if none)."""
+        pos = self.lookup_position(row, fallback=fallback, strict=strict)
+        return self.df.iloc[[]] if pos is None else self.df.iloc[[pos]]
+
+    @timed()
+    def lightest(self, row) -> pd.DataFrame:
+        """
+        Lightest row of `row`'s finest group (first in sort_by order) if its first sort key is
+        strictly lower; no dominance or different-beverage check. Empty if none.
+        """
+        if not self.sort_by or self.sort_by[0] not in row or pd.isna(row[self.sort_by[0]]):
+            return self.df.iloc[[]]
+        cols, groups = self._levels[0]
+        key = self._group_key(row, cols)
+        if key is None or key not in groups or len(groups[key]) == 0:
+            return self.df.iloc[[]]
+        pos = int(groups[key][0])
+        return self.df.iloc[[pos]] if self._keys[pos, 0] < float(row[self.sort_by[0]]) else self.df.iloc[[]]
+
+@timed()
+def healthier_alternative(df: pd.DataFrame, row, by=["category","prep"], sort_by=["calories","sugar_g"], index: SwapIndex = None):
+    """
+    Find a similar but lighter option in same (category, prep) if possible; else same category; else global.
+    Without an index this is one masked scan of the frame (same rule as SwapIndex.lookup);
+    pass a prebuilt SwapIndex when calling repeatedly on the same frame.
+    """
+    if index is not None:
+        return index.lookup(row)
+    by = [c for c in by if c in df.columns]
+    sort_by = [c for c in sort_by if c in df.columns]
+    if any(c not in row or pd.isna(row[c]) for c in sort_by):
+        return df.iloc[[]]
+    if sort_by:
+        keys = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in sort_by])
+        target = np.array([float(row[c]) for c in sort_by])
+    else:
+        keys, target = np.zeros((len(df), 1)), np.zeros(1)
+    # Không tệ hơn ở mọi khóa (NaN tự loại) và khác tên đồ uống
+    base = (keys <= target).all(axis=1)
+    if "beverage" in df.columns and "beverage" in row and pd.notna(row["beverage"]):
+        base &= (df["beverage"] != row["beverage"]).to_numpy()
+    for depth in range(len(by), -1, -1):
+        cols = by[:depth]
+        if any(c not in row or pd.isna(row[c]) for c in cols):
+            continue
+        mask = base.copy()
+        for c in cols:
+            mask &= (df[c] == row[c]).to_numpy()
+        cand = np.flatnonzero(mask)
+        if cand.size:
+            best = cand[np.lexsort(tuple(keys[cand].T[::-1]))[0]]
+            return df.iloc[[best]]
+    return df.iloc[[]]
+
+def _min_sparse_table(values: np.ndarray) -> list:
+    """table[k][i] = min(values[i : i + 2**k])."""
+    table = [values]
+    step = 1
+    while 2 * step <= len(values):
+        prev = table[-1]
+        table.append(np.minimum(prev[:-step], prev[step:]))
+        step *= 2
+    return table
+
+def _first_at_most(table: list, start: np.ndarray, stop: np.ndarray, limit: np.ndarray) -> np.ndarray:
+    """Vectorized: for each query, first p in [start, stop) with values[p] <= limit (stop if none)."""
+    pos = start.copy()
+    for k in range(len(table) - 1, -1, -1):
+        step = 1 << k
+        tk = table[k]
+        jump = pos + step <= stop
+        idx = np.minimum(pos, len(tk) - 1)
+        jump &= tk[idx] > limit
+        pos[jump] += step
+    return pos
+
+@timed()
+def healthier_alternatives_bulk(df: pd.DataFrame, by=["category","prep"], sort_by=["calories","sugar_g"]) -> pd.DataFrame:
+    """
+    healthier_alternative for every row at once (same ordering and fallback as SwapIndex).
+    Each group level is sorted once; the first dominating row is found with a vectorized
+    binary-lifting search over a min sparse table of the second sort key, so there is no
+    per-row Python loop. Returns one row per input row with the swap and the amount saved.
+    """
+    by = [c for c in by if c in df.columns]
+    sort_by = [c for c in sort_by if c in df.columns]
+    n = len(df)
+    result = np.full(n, -1, dtype=np.int64)
+    level_of = np.full(n, "", dtype=object)
+    if n and sort_by:
+        keys = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in sort_by])
+        valid = ~np.isnan(keys).any(axis=1)
+        bev = pd.factorize(df["beverage"])[0] if "beverage" in df.columns else np.full(n, -1)
+        for depth in range(len(by), -1, -1):
+            cols = by[:depth]
+            gid = df.groupby(cols, observed=True, sort=False).ngroup().to_numpy() if cols else np.zeros(n, dtype=np.int64)
+            rows = np.flatnonzero(valid & (gid >= 0))
+            if rows.size == 0:
+                continue
+            # Sắp xếp theo (group, sort_by...) một lần cho cả level
+            order = rows[np.lexsort(tuple(keys[rows].T[::-1]) + (gid[rows],))]
+            g_s, k_s = gid[order], keys[order]
+            group_start = np.searchsorted(g_s, g_s, side="left")
+            # hi = số dòng trong group có khóa đầu <= khóa đầu của query
+            rank = pd.Series(k_s[:, 0]).groupby(g_s).rank(method="max").to_numpy().astype(np.int64)
+            hi = group_start + rank
+            second = k_s[:, 1] if k_s.shape[1] > 1 else k_s[:, 0]
+            table = _min_sparse_table(second)
+            # next_diff[i] = vị trí đầu tiên sau i có beverage khác -> nhảy qua cả dải bản sao cùng tên
+            bev_s = bev[order]
+            run_end = np.flatnonzero(np.r_[bev_s[1:] != bev_s[:-1], True]) + 1
+            next_diff = run_end[np.r_[0, np.cumsum(bev_s[1:] != bev_s[:-1])]]
+
+            # Chỉ xử lý các dòng chưa có swap ở level chi tiết hơn
+            queries = np.flatnonzero(result[order] < 0)
+            p = group_start[queries]
+            while queries.size:
+                j = _first_at_most(table, p, hi[queries], second[queries])
+                found = j < hi[queries]
+                queries, p, j = queries[found], p[found], j[found]
+                same = bev_s[j] == bev_s[queries]
+                ok = ~same & (k_s[j] <= k_s[queries]).all(axis=1)
+                hit = queries[ok]
+                result[order[hit]] = order[j[ok]]
+                level_of[order[hit]] = "+".join(cols) if cols else "global"
+                queries, p = queries[~ok], np.where(same, next_diff[j], j + 1)[~ok]
+
+    has = result >= 0
+    out = pd.DataFrame(index=df.index)
+    out["swap_row"] = pd.Series(df.index[result[has]], index=df.index[has]).reindex(df.index)
+    if pd.api.types.is_integer_dtype(df.index):
+        out["swap_row"] = out["swap_row"].astype("Int64")
+    for c in ["beverage", "prep"]:
+        if c in df.columns:
+            out[f"swap_{c}"] = pd.Series(df[c].to_numpy()[result[has]], index=df.index[has]).reindex(df.index)
+    for c in sort_by:
+        vals = df[c].to_numpy(dtype=np.float64, na_value=np.nan)
+        saved = np.full(n, np.nan)
+        saved[has] = vals[has] - vals[result[has]]
+        out[f"{c}_saved"] = saved
+    out["swap_level"] = pd.Series(level_of, index=df.index).replace("", np.nan)
+    return out
+
+# Mục tiêu mặc định cho skyline: cột -> "min" (càng thấp càng tốt) hoặc "max"
+PARETO_OBJECTIVES = {"calories": "min", "sugar_g": "min", "fat_g": "min", "caffeine_mg": "max", "protein_g": "max"}
+
+def _skyline_positions(values: np.ndarray) -> np.ndarray:
+    """
+    Sort-filter skyline (sort-based block-nested-loop) over a minimization matrix.
+    Points are visited in order of a monotone score, so a point can only be dominated by
+    one visited earlier and only the current skyline window has to be checked.
+    """
+    n, d = values.shape
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    lo, span = values.min(axis=0), np.ptp(values, axis=0)
+    score = ((values - lo) / np.where(span > 0, span, 1)).sum(axis=1)
+    order = np.lexsort(tuple(values.T[::-1]) + (score,))
+    window = np.empty((n, d))
+    kept = []
+    for i in order:
+        p = values[i]
+        w = window[:len(kept)]
+        if ((w <= p).all(axis=1) & (w < p).any(axis=1)).any():
+            continue
+        window[len(kept)] = p
+        kept.append(i)
+    return np.sort(np.array(kept, dtype=np.int64))
+
+@timed()
+def pareto_front(df: pd.DataFrame, objectives: dict = None, by: str = "category") -> pd.DataFrame:
+    """
+    Pareto-optimal (non-dominated) rows for the given objectives {column: "min"|"max"},
+    computed separately inside each `by` group (by=None for the whole menu).
+    Rows missing any objective are ignored.
+    """
+    objectives = {c: d for c, d in (objectives or PARETO_OBJECTIVES).items() if c in df.columns}
+    if not objectives:
+        return df.iloc[[]]
+    signs = np.array([1.0 if d == "min" else -1.0 for d in objectives.values()])
+    values = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in objectives]) * signs
+    valid = ~np.isnan(values).any(axis=1)
+
+    if by and by in df.columns:
+        groups = df.groupby(by, observed=True, sort=False).indices.values()
+    else:
+        groups = [np.arange(len(df))]
+    keep = []
+    for idx in groups:
+        idx = idx[valid[idx]]
+        keep.append(idx[_skyline_positions(values[idx])])
+    keep = np.sort(np.concatenate(keep)) if keep else np.empty(0, dtype=np.int64)
+    return df.iloc[keep]
+
+# Health Personas: giới hạn "<=" (max) + trọng số mục tiêu (dương = càng cao càng tốt, âm = càng thấp càng tốt)
+PERSONAS = {
+    "Weight Loss (Low Calorie)": {
+        "max": {"calories": 150, "sugar_g": 20},
+        "weights": {"calories": -1.0},
+    },
+    "Low Carb / Keto (Low Sugar & Fat)": {
+        "max": {"calories": 250, "sugar_g": 5},
+        "weights": {"sugar_g": -1.0},
+    },
+    "The Clean Caffeine Boost (Max Caffeine/Min Sugar)": {
+        "max": {"calories": 200, "sugar_g": 5},
+        "weights": {"caffeine_mg": 1.0},
+    },
+}
+
+@timed()
+def compile_personas(personas: dict, columns: list):
+    """
+    Turn persona specs into a weight matrix W (P x m) and a limit matrix L (P x m, +inf = no limit).
+    A weight or limit on a column outside `columns` raises ValueError.
+    """
+    names = list(personas)
+    W = np.zeros((len(names), len(columns)))
+    L = np.full((len(names), len(columns)), np.inf)
+    col_pos = {c: j for j, c in enumerate(columns)}
+    for i, name in enumerate(names):
+        spec = personas[name]
+        weights, limits = spec.get("weights", {}), spec.get("max", {})
+        # Sai tên cột sẽ biến persona thành "không trọng số, không giới hạn" -> báo lỗi luôn
+        unknown = sorted(set(weights) - set(col_pos)) + sorted(set(limits) - set(col_pos))
+        if unknown:
+            raise ValueError(f"persona {name!r}: unknown column(s) {unknown}; expected some of {list(columns)}")
+        for c, w in weights.items():
+            W[i, col_pos[c]] = w
+        for c, limit in limits.items():
+            L[i, col_pos[c]] = limit
+    return names, W, L
+
+@timed()
+def persona_scores(df: pd.DataFrame, personas: dict = None, index: NutrientRangeIndex = None) -> pd.DataFrame:
+    """
+    Score every row for every persona in one matrix product (n x P).
+    Scores use z-scored columns times the persona weights; rows that break a limit or miss
+    a weighted value get -inf. A NutrientRangeIndex can be passed to resolve the limits.
+    """
+    personas = personas or PERSONAS
+    columns = numeric_columns(df)
+    names, W, L = compile_personas(personas, columns)
+    X = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in columns]) if columns \
+        else np.zeros((len(df), 0))
+    mean, std = np.nanmean(X, axis=0), np.nanstd(X, axis=0)
+    Z = (X - mean) / np.where(std > 0, std, 1)
+    S = np.nan_to_num(Z) @ W.T
+
+    missing = np.isnan(X).astype(np.float64) @ (W != 0).T.astype(np.float64) > 0
+    if index is not None:
+        feasible = np.zeros(S.shape, dtype=bool)
+        for i in range(len(names)):
+            limits = {c: L[i, j] for j, c in enumerate(columns) if np.isfinite(L[i, j])}
+            feasible[index.positions(**limits), i] = True
+    else:
+        feasible = np.ones(S.shape, dtype=bool)
+        for j in np.flatnonzero(np.isfinite(L).any(axis=0)):
+            feasible &= (X[:, j:j + 1] <= L[:, j][None, :]) | ~np.isfinite(L[:, j])[None, :]
+    S[~feasible | missing] = -np.inf
+    return pd.DataFrame(S, index=df.index, columns=names)
+
+@timed()
+def persona_top_k(df: pd.DataFrame, k: int = 5, personas: dict = None, scores: pd.DataFrame = None) -> dict:
+    """Top-k rows per persona {name: DataFrame}, best first; reuse a precomputed persona_scores matrix."""
+    if scores is None:
+        scores = persona_scores(df, personas)
+    S = scores.to_numpy()
+    out = {}
+    for i, name in enumerate(scores.columns):
+        col = S[:, i]
+        kk = max(0, min(k, int(np.isfinite(col).sum())))
+        if kk == 0:
+            out[name] = df.iloc[[]]
+            continue
+        part = np.argpartition(-col, kk - 1)[:kk]
+        best = part[np.lexsort((part, -col[part]))]
+        out[name] = df.iloc[best]
+    return out
+
+def _rank_keys(df: pd.DataFrame, specs) -> np.ndarray:
+    """n x len(specs) matrix where smaller = better for each (col, asc); NaN ranks last."""
+    keys = np.empty((len(df), len(specs)))
+    for j, (col, asc) in enumerate(specs):
+        vals = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        keys[:, j] = np.nan_to_num(vals if asc else -vals, nan=np.inf)
+    return keys
+
+def _select_top(keys: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k best rows per column of `keys` (k x S), best first, ties by position."""
+    n = keys.shape[0]
+    k = min(k, n)
+    if k == 0:
+        return np.empty((0, keys.shape[1]), dtype=np.int64)
+    # k-th best value per column in one partition call; ties at the cut go to the earliest rows
+    kth = np.partition(keys, k - 1, axis=0)[k - 1]
+    out = np.empty((k, keys.shape[1]), dtype=np.int64)
+    for j in range(keys.shape[1]):
+        col = keys[:, j]
+        better = np.flatnonzero(col < kth[j])
+        p = np.concatenate([better, np.flatnonzero(col == kth[j])[:k - len(better)]])
+        out[:, j] = p[np.lexsort((p, col[p]))]
+    return out
+
+@timed()
 def top_k(df: pd.DataFrame, col: str, k: int = 10, asc: bool = False):
+    """k rows with the highest (asc=False) or lowest values of `col`, via argpartition instead of a full sort."""
     if col not in df.columns: return pd.DataFrame()
-    return df.sort_values(col, ascending=asc).head(k)
+    return df.iloc[_select_top(_rank_keys(df, [(col, asc)]), k)[:, 0]]
+
+@timed()
+def top_k_multi(df: pd.DataFrame, specs, k: int = 10) -> dict:
+    """Several rankings [(col, asc), ...] from one shared argpartition pass -> {(col, asc): DataFrame}."""
+    specs = [(c, a) for c, a in specs if c in df.columns]
+    if not specs:
+        return {}
+    sel = _select_top(_rank_keys(df, specs), k)
+    return {spec: df.iloc[sel[:, j]] for j, spec in enumerate(specs)}
 
+@timed()
+def grouped_top_k(df: pd.DataFrame, col: str, by="category", k: int = 5, asc: bool = False) -> pd.DataFrame:
+    """Top k rows of `col` inside every `by` group with a single lexsort (groups in order of first appearance)."""
+    if col not in df.columns or len(df) == 0:
+        return df.iloc[[]]
+    gid = df.groupby(by, observed=True, sort=False).ngroup().to_numpy()
+    key = _rank_keys(df, [(col, asc)])[:, 0]
+    pos = np.arange(len(df))
+    order = np.lexsort((pos, key, gid))
+    order = order[gid[order] >= 0]
+    g = gid[order]
+    rank = np.arange(len(order)) - np.searchsorted(g, g, side="left")
+    return df.iloc[order[rank < k]]
+
+@timed()
 def numeric_columns(df: pd.DataFrame):
     return [c for c in ["calories","sugar_g","carbs_g","fat_g","sat_fat_g","protein_g","sodium_mg","cholesterol_mg","fiber_g","caffeine_mg"] if c in df.columns]
 
+# --- Aggregate cube cho KPI (rollup theo bộ lọc thay vì quét lại từng dòng) ---
+CUBE_DIMS = ["category", "prep", "health_tier"]
+# Bộ đếm ngưỡng tính sẵn trong cube: tên -> (cột, giá trị ">")
+CUBE_THRESHOLDS = {"sugar_over_40": ("sugar_g", 40)}
+
+@timed()
+def cube_columns(df: pd.DataFrame) -> list:
+    return numeric_columns(df) + [c for c in ["nutrient_score", "efficiency_index"] if c in df.columns]
+
+@timed()
+def build_nutrient_cube(df: pd.DataFrame, dims=CUBE_DIMS, columns=None) -> pd.DataFrame:
+    """
+    Sufficient statistics per (dims) cell: row count, and for every nutrient
+    count / sum / sum of squares / min / max, plus the CUBE_THRESHOLDS counters.
+    Cells are additive, so any filter combination rolls up without touching the rows.
+    """
+    dims = [d for d in dims if d in df.columns]
+    columns = [c for c in (columns or cube_columns(df)) if c in df.columns]
+    vals = pd.DataFrame({c: df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in columns}, index=df.index)
+    parts = {f"{c}__sq": vals[c] ** 2 for c in columns}
+    for name, (col, limit) in CUBE_THRESHOLDS.items():
+        if col in vals:
+            parts[name] = (vals[col] > limit).astype(np.int64)
+    work = pd.concat([vals, pd.DataFrame(parts, index=df.index)], axis=1)
+    if dims:
+        g = work.groupby([df[d] for d in dims], observed=True, dropna=False, sort=False)
+    else:
+        g = work.groupby(np.zeros(len(df), dtype=np.int64))
+    stats = {"rows": g.size()}
+    for c in columns:
+        stats[f"{c}__count"] = g[c].count()
+        stats[f"{c}__sum"] = g[c].sum()
+        stats[f"{c}__sumsq"] = g[f"{c}__sq"].sum()
+        stats[f"{c}__min"] = g[c].min()
+        stats[f"{c}__max"] = g[c].max()
+    for name in CUBE_THRESHOLDS:
+        if name in work:
+            stats[name] = g[name].sum()
+    cube = pd.DataFrame(stats)
+    return cube.reset_index() if dims else cube.reset_index(drop=True)
+
+def _combine_cells(cells: pd.DataFrame, by=None, dropna: bool = True) -> pd.DataFrame:
+    """Sum the additive statistics and take min/max of the extrema, per `by` or overall."""
+    additive = [c for c in cells.columns if c == "rows" or c.endswith(("__count", "__sum", "__sumsq")) or c in CUBE_THRESHOLDS]
+    mins = [c for c in cells.columns if c.endswith("__min")]
+    maxs = [c for c in cells.columns if c.endswith("__max")]
+    if by:
+        g = cells.groupby(by, observed=True, sort=True, dropna=dropna)
+        return pd.concat([g[additive].sum(), g[mins].min(), g[maxs].max()], axis=1)
+    return pd.DataFrame([pd.concat([cells[additive].sum(), cells[mins].min(), cells[maxs].max()])])
+
+@timed()
+def merge_cubes(cubes, dims=CUBE_DIMS) -> pd.DataFrame:
+    """Fold several cubes (e.g. one per chunk or region) into one with the same layout."""
+    cells = pd.concat(list(cubes), ignore_index=True)
+    dims = [d for d in dims if d in cells.columns]
+    if not dims:
+        return _combine_cells(cells)
+    return _combine_cells(cells, dims, dropna=False).reset_index()
+
+@timed()
+def rollup_cube(cube: pd.DataFrame, by=None, **filters) -> pd.DataFrame:
+    """
+    Combine the cube cells whose dims are in `filters` ({dim: [values]}, empty/None = all)
+    into rows, <col>_mean/_std/_min/_max/_count and threshold counts — per `by` dim(s)
+    or as a single total row.
+    """
+    mask = np.ones(len(cube), dtype=bool)
+    for dim, values in filters.items():
+        if values is not None and len(values) and dim in cube.columns:
+            mask &= cube[dim].isin(list(values)).to_numpy()
+    agg = _combine_cells(cube[mask], by)
+    additive = [c for c in agg.columns if c == "rows" or c.endswith(("__count", "__sum", "__sumsq")) or c in CUBE_THRESHOLDS]
+
+    out = pd.DataFrame({"rows": agg["rows"]}, index=agg.index)
+    for c in [c[:-len("__count")] for c in additive if c.endswith("__count")]:
+        n, total, sq = agg[f"{c}__count"], agg[f"{c}__sum"], agg[f"{c}__sumsq"]
+        mean = total / n.where(n > 0)
+        out[f"{c}_count"] = n
+        out[f"{c}_mean"] = mean
+        out[f"{c}_std"] = np.sqrt(((sq - total * mean) / (n - 1).where(n > 1)).clip(lower=0))
+        out[f"{c}_min"] = agg[f"{c}__min"]
+        out[f"{c}_max"] = agg[f"{c}__max"]
+    for name in CUBE_THRESHOLDS:
+        if name in agg:
+            out[name] = agg[name]
+    return out
+
+# --- Đọc streaming theo chunk (feed nhiều vùng lớn hơn RAM) ---
+# File lớn hơn ngưỡng này thì KPI được gộp từng chunk thay vì load cả frame
+STREAM_THRESHOLD_BYTES = 256 * 1024 ** 2
+
+@timed()
+def resolve_schema(path: str) -> dict:
+    """Read only the header once: raw names, normalized names and the raw header of each text dim."""
+    raw = list(pd.read_csv(path, nrows=0).columns)
+    names = normalize_names(raw)
+    return {
+        "raw": raw,
+        "names": names,
+        "text": {n: r for n, r in zip(names, raw) if n in ("category", "beverage", "prep")},
+    }
+
+def iter_menu_chunks(path: str, chunksize: int = 200_000, schema: dict = None):
+    """
+    Yield normalized chunks of a (possibly huge) menu CSV. Column names come from the
+    schema resolved once up front; each chunk only gets numeric coercion. Header lines
+    repeated inside a concatenated multi-region feed are dropped.
+    """
+    schema = schema or resolve_schema(path)
+    text = schema["text"]
+    reader = pd.read_csv(path, chunksize=chunksize, header=0, names=schema["names"], dtype={n: str for n in text})
+    for chunk in reader:
+        if text:
+            repeated = np.logical_and.reduce([(chunk[n] == r).to_numpy(dtype=bool, na_value=False) for n, r in text.items()])
+            if repeated.any():
+                chunk = chunk[~repeated]
+        yield coerce_numeric(chunk)
+
+@timed()
+def stream_nutrient_cube(path: str, chunksize: int = 200_000, dims=CUBE_DIMS) -> pd.DataFrame:
+    """
+    build_nutrient_cube over a CSV of any size without materializing the menu:
+    each chunk gets add_features, is reduced to its cube and folded into the running one.
+    """
+    cube = None
+    for chunk in iter_menu_chunks(path, chunksize):
+        part = build_nutrient_cube(add_features(chunk), dims)
+        cube = part if cube is None else merge_cubes([cube, part], dims)
+    return cube
+
+# --- Ma trận tương quan từ thống kê đủ (cộng các block theo bộ lọc) ---
+@timed()
+def build_corr_stats(df: pd.DataFrame, dims=("category", "health_tier"), columns=None, ranks: bool = False) -> dict:
+    """
+    Per-cell cross-product blocks for pairwise-complete Pearson correlation.
+    For each (dims) cell: N = pairwise counts, S = pairwise sums, Q = pairwise sums of squares
+    and P = X^T X, on columns centered by the global mean (for numerical stability).
+    ranks=True uses ranks over the whole frame instead of raw values (Spearman-style).
+    """
+    columns = list(columns or df.select_dtypes(include=[np.number]).columns)
+    dims = [d for d in dims if d in df.columns]
+    X = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in columns]) if columns \
+        else np.zeros((len(df), 0))
+    if ranks:
+        X = pd.DataFrame(X).rank().to_numpy()
+    present = (~np.isnan(X)).astype(np.float64)
+    X0 = np.nan_to_num(X - np.nanmean(X, axis=0) if len(X) else X)
+
+    groups = df.groupby(dims, observed=True, sort=False).indices if dims else {(): np.arange(len(df))}
+    keys, blocks = [], []
+    for key, idx in groups.items():
+        x, m = X0[idx], present[idx]
+        blocks.append(np.stack([m.T @ m, x.T @ m, (x * x).T @ m, x.T @ x]))
+        keys.append(key if isinstance(key, tuple) else (key,))
+    return {
+        "columns": columns,
+        "cells": pd.DataFrame(keys, columns=dims) if dims else pd.DataFrame(index=range(len(keys))),
+        "blocks": np.stack(blocks) if blocks else np.zeros((0, 4, len(columns), len(columns))),
+    }
+
+@timed()
+def correlation_from_stats(stats: dict, **filters) -> pd.DataFrame:
+    """Correlation matrix for the rows in the cells matching {dim: [values]}, assembled from cached blocks."""
+    cells = stats["cells"]
+    mask = np.ones(len(cells), dtype=bool)
+    for dim, values in filters.items():
+        if values is not None and len(values) and dim in cells.columns:
+            mask &= cells[dim].isin(list(values)).to_numpy()
+    N, S, Q, P = stats["blocks"][mask].sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        var = N * Q - S ** 2
+        corr = (N * P - S * S.T) / np.sqrt(var * var.T)
+    corr[~np.isfinite(corr)] = np.nan
+    return pd.DataFrame(np.clip(corr, -1, 1), index=stats["columns"], columns=stats["columns"])
+
 # --- 2. Hàm xuất PDF ---
-def export_insights_pdf(filename, kpis: dict, highlights: list[str]):
+@functools.lru_cache(maxsize=1)
+@timed()
+def report_styles():
+    """ReportLab stylesheet shared by every report built in this process."""
+    return _rl_styles.getSampleStyleSheet()
+
+@timed()
+def export_insights_pdf(filename, kpis: dict, highlights: list[str], images: list[str] = None,
+                        title: str = "Starbucks Drinks Nutrition Report", tables: list = None):
     """
     Generate a simple PDF report with KPIs + textual highlights.
+    Optional chart images (PNG paths) and extra tables (lists of rows, header first) are appended.
     """
-    doc = SimpleDocTemplate(filename, pagesize=A4)
-    styles = getSampleStyleSheet()
+    SimpleDocTemplate, Paragraph, Spacer, Table, Image = (
+        _rl_platypus.SimpleDocTemplate, _rl_platypus.Paragraph, _rl_platypus.Spacer, _rl_platypus.Table, _rl_platypus.Image)
+    doc = SimpleDocTemplate(filename, pagesize=_rl_pagesizes.A4)
+    styles = report_styles()
     story = []
 
-    story.append(Paragraph("<b>Starbucks Drinks Nutrition Report</b>", styles["Title"]))
+    story.append(Paragraph(f"<b>{title}</b>", styles["Title"]))
     story.append(Spacer(1, 12))
 
     story.append(Paragraph("📊 Key Metrics", styles["Heading2"]))
@@ -105,15 +1066,24 @@ def export_insights_pdf(filename, kpis: dict, highlights: list[str]):
         story.append(Paragraph("• " + h, styles["Normal"]))
         story.append(Spacer(1, 6))
 
+    for rows in tables or []:
+        story.append(Spacer(1, 12))
+        story.append(Table(rows, hAlign="LEFT", repeatRows=1))
+
+    for img in images or []:
+        story.append(Spacer(1, 12))
+        story.append(Image(img, width=440, height=260))
+
     doc.build(story)
     return filename
 
 # --- 3. Hàm mới cho Machine Learning (Cái bạn cần thêm đây) ---
-def get_clean_data_for_ml(df: pd.DataFrame, target_col: str = "category"):
+@timed()
+def get_clean_data_for_ml(df: pd.DataFrame, target_col: str = "category", medians: pd.Series = None):
     """
     Hàm chuẩn hóa dữ liệu chuyên biệt cho Machine Learning (KNN/KMeans).
     1. Lấy các cột số (features).
-    2. Điền giá trị thiếu (NaN) bằng trung vị (median).
+    2. Điền giá trị thiếu (NaN) bằng trung vị (median) - hoặc bằng `medians` đã đóng băng từ lúc train.
     3. Tách X (features) và y (target).
     """
     # 1. Lấy cột số
@@ -132,6 +1102,139 @@ def get_clean_data_for_ml(df: pd.DataFrame, target_col: str = "category"):
     X = df_clean[feature_cols].copy()
     
     # KNN không chạy được nếu có NaN -> Điền bằng median
-    X = X.fillna(X.median())
+    X = X.fillna(X.median() if medians is None else medians)
     
-    return X, y, feature_cols
\ No newline at end of file
+    return X, y, feature_cols
+
+class HealthierNeighborIndex:
+    """
+    Nearest-healthier-neighbor search.
+    numeric_columns are median-imputed and standardized (as in 4_Models), one KD-tree is
+    built per `by` group, and a query returns the k closest drinks that are no worse on
+    every `dominate` column and strictly better on at least one.
+    """
+
+    @timed("HealthierNeighborIndex.build")
+    def __init__(self, df: pd.DataFrame, by: str = "category", dominate=("calories", "sugar_g")):
+        self.df = df
+        X, _, self.features = get_clean_data_for_ml(df, target_col=None)
+        self.scaler = _sk_preprocessing.StandardScaler().fit(X)
+        self._Z = self.scaler.transform(X)
+        self.dominate = [c for c in dominate if c in df.columns]
+        self._dom = np.column_stack([df[c].to_numpy(dtype=np.float64, na_value=np.nan) for c in self.dominate]) \
+            if self.dominate else np.zeros((len(df), 0))
+        self.by = by if by in df.columns else None
+        if self.by:
+            self._group_of = df[self.by].to_numpy()
+            groups = df.groupby(self.by, observed=True, sort=False).indices
+        else:
+            self._group_of = np.zeros(len(df))
+            groups = {0: np.arange(len(df))}
+        self._trees = {key: (idx, _sk_neighbors.KDTree(self._Z[idx])) for key, idx in groups.items()}
+
+    @timed()
+    def query(self, pos: int, k: int = 5) -> pd.DataFrame:
+        """k most similar healthier drinks for the row at position `pos`, with a `distance` column."""
+        key = self._group_of[pos]
+        if key not in self._trees:
+            return self.df.iloc[[]].assign(distance=[])
+        idx, tree = self._trees[key]
+        target = self._dom[pos]
+        fetch = min(len(idx), 4 * k)
+        while True:
+            dist, nb = tree.query(self._Z[pos:pos + 1], k=fetch)
+            cand, dist = idx[nb[0]], dist[0]
+            dom = self._dom[cand]
+            mask = (dom <= target).all(axis=1) & (dom < target).any(axis=1)
+            if mask.sum() >= k or fetch == len(idx):
+                break
+            fetch = min(len(idx), 2 * fetch)
+        cand, dist = cand[mask][:k], dist[mask][:k]
+        return self.df.iloc[cand].assign(distance=dist)
+
+
+# --- 4. So sánh hai đồ uống (trang 2_Compare) ---
+COMPARE_METRICS = ["calories", "sugar_g", "fat_g", "protein_g", "carbs_g", "caffeine_mg"]
+
+class CompareMatrix:
+    """
+    Dense nutrient matrix over the distinct drink names (first row of each full_name wins,
+    like the old `df[df.full_name == x].iloc[0]`). A name resolves to its row through a dict,
+    A-vs-B deltas are row differences. closest() computes one row of distances on the
+    standardized metrics on demand; the all-pairs matrix is only built (once) for
+    pairwise_table. Missing values count as 0.
+    """
+
+    @timed("CompareMatrix.build")
+    def __init__(self, df: pd.DataFrame, metrics=COMPARE_METRICS, name_col: str = "full_name"):
+        self.metrics = [m for m in metrics if m in df.columns]
+        codes, names = pd.factorize(df[name_col].astype(str))
+        first = np.full(len(names), -1, dtype=np.int64)
+        first[codes[::-1]] = np.arange(len(df))[::-1]
+        self.names = np.asarray(names, dtype=object)
+        self.rows = first
+        self.position = {name: i for i, name in enumerate(self.names)}
+        values = [df[m].to_numpy(dtype=np.float64, na_value=np.nan)[first] for m in self.metrics]
+        self.values = np.nan_to_num(np.column_stack(values), nan=0.0) if values else np.zeros((len(first), 0))
+        self.category = df["category"].to_numpy(dtype=object)[first] if "category" in df.columns else None
+        std = self.values.std(axis=0)
+        self._z = (self.values - self.values.mean(axis=0)) / np.where(std > 0, std, 1.0)
+        self._distances = None
+
+    def lookup(self, name: str) -> int:
+        """Position of `name` in the matrix (KeyError if unknown)."""
+        return self.position[name]
+
+    def vector(self, name: str) -> pd.Series:
+        return pd.Series(self.values[self.position[name]], index=self.metrics)
+
+    def delta(self, a: str, b: str) -> pd.Series:
+        """a - b for every metric."""
+        return pd.Series(self.values[self.position[a]] - self.values[self.position[b]], index=self.metrics)
+
+    @property
+    def distances(self) -> np.ndarray:
+        """All-pairs Euclidean distance on the standardized metrics (n x n, float32)."""
+        if self._distances is None:
+            sq = (self._z ** 2).sum(axis=1)
+            d2 = sq[:, None] + sq[None, :] - 2.0 * (self._z @ self._z.T)
+            self._distances = np.sqrt(np.clip(d2, 0, None)).astype(np.float32)
+            np.fill_diagonal(self._distances, 0)
+        return self._distances
+
+    @timed()
+    def closest(self, name: str, k: int = 5, same_category: bool = False) -> pd.DataFrame:
+        """The k nearest other drinks to `name`, with their distance and deltas (other - name)."""
+        i = self.position[name]
+        # Một dòng O(n), không dựng ma trận n x n
+        dist = np.linalg.norm(self._z - self._z[i], axis=1)
+        dist[i] = np.inf
+        if same_category and self.category is not None:
+            dist[self.category != self.category[i]] = np.inf
+        k = min(k, int(np.isfinite(dist).sum()))
+        if k <= 0:
+            return pd.DataFrame(columns=["name", "distance"] + [f"delta_{m}" for m in self.metrics])
+        nearest = np.argpartition(dist, k - 1)[:k]
+        nearest = nearest[np.lexsort((nearest, dist[nearest]))]
+        out = pd.DataFrame({"name": self.names[nearest], "distance": dist[nearest]})
+        deltas = self.values[nearest] - self.values[i]
+        for j, m in enumerate(self.metrics):
+            out[f"delta_{m}"] = deltas[:, j]
+        return out
+
+    @timed()
+    def pairwise_table(self, names=None) -> pd.DataFrame:
+        """
+        Every ordered pair (a, b), a != b, among `names` (default: all) with the distance and
+        delta_<metric> = a - b, built with one broadcast. Grows as n^2 rows.
+        """
+        idx = np.arange(len(self.names)) if names is None else np.array([self.position[n] for n in names], dtype=np.int64)
+        n = len(idx)
+        a, b = np.divmod(np.arange(n * n), n)
+        keep = a != b
+        a, b = idx[a[keep]], idx[b[keep]]
+        out = pd.DataFrame({"a": self.names[a], "b": self.names[b], "distance": self.distances[a, b]})
+        deltas = (self.values[idx][:, None, :] - self.values[idx][None, :, :]).reshape(n * n, -1)[keep]
+        for j, m in enumerate(self.metrics):
+            out[f"delta_{m}"] = deltas[:, j]
+        return out
@@ -1,7 +1,9 @@
 import streamlit as st
 import pandas as pd
 import altair as alt
-from src.utils import load_data
+from src.data import get_cube, get_members, get_menu, is_large_feed
+from src.utils import rollup_cube, top_k_multi
+from src.telemetry import begin_rerun, dev_panel, end_rerun, section
 
 # --- 1. PAGE CONFIGURATION ---
 st.set_page_config(
@@ -11,26 +13,34 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# --- 2. DATA LOADING & PREPARATION ---
-@st.cache_data
-def get_data():
-    return load_data("data/Nutrition_facts_for_Starbucks_Menu_1604_26.csv")
+begin_rerun("home")
 
+# --- 2. DATA LOADING & PREPARATION ---
+section("home/load")
+# Feed lớn: trang chủ chỉ dùng cube stream từ CSV, không load toàn bộ menu
+large_feed = is_large_feed()
 try:
-    df = get_data()
+    cube = get_cube()
+    df = None if large_feed else get_menu()
 except Exception as e:
     st.error(f"⚠️ System Error: Unable to load data. Details: {e}")
     st.stop()
 
+if cube is None or (df is None and not large_feed):
+    st.error("⚠️ System Error: Unable to load data. Please ensure the CSV is in the data folder.")
+    st.stop()
+
 # --- 3. SIDEBAR: CONTROL PANEL ---
+section("home/sidebar")
 with st.sidebar:
     st.image("https://upload.wikimedia.org/wikipedia/en/thumb/d/d3/Starbucks_Corporation_Logo_2011.svg/1200px-Starbucks_Corporation_Logo_2011.svg.png", width=80)
     
     st.header("🎛️ Analysis Controls")
     
     # Filter Logic
-    if 'category' in df.columns:
-        all_categories = df['category'].unique().tolist()
+    source = cube if large_feed else df
+    if 'category' in source.columns:
+        all_categories = source['category'].dropna().unique().tolist()
         st.caption("Select product categories to analyze:")
         selected_cats = st.multiselect(
             "Category Filter", 
@@ -57,8 +67,10 @@ with st.sidebar:
     st.caption("v2.2 | Portfolio Project")
 
 # Apply Filter
-if selected_cats and 'category' in df.columns:
-    df_filtered = df[df['category'].isin(selected_cats)]
+if large_feed:
+    df_filtered = None
+elif selected_cats and 'category' in df.columns:
+    df_filtered = get_members().select(category=selected_cats)
 else:
     df_filtered = df
 
@@ -74,16 +86,18 @@ st.markdown("""
 st.divider()
 
 # --- SECTION A: REAL-WORLD CONTEXT (BENCHMARKS) ---
+section("home/health_impact")
 st.subheader("1. Health Impact Overview")
 
-if not df_filtered.empty:
+# Calculate Metrics safely (rollup từ aggregate cube, không quét lại các dòng)
+rollup = rollup_cube(cube, category=selected_cats)
+if not rollup.empty and rollup.iloc[0]['rows'] > 0:
     cols = st.columns(4)
-    
-    # Calculate Metrics safely
-    avg_sugar = df_filtered['sugar_g'].mean() if 'sugar_g' in df_filtered.columns else 0
-    avg_cal = df_filtered['calories'].mean() if 'calories' in df_filtered.columns else 0
-    max_caffeine = df_filtered['caffeine_mg'].max() if 'caffeine_mg' in df_filtered.columns else 0
-    total_items = len(df_filtered)
+    kpi = rollup.iloc[0]
+    avg_sugar = kpi['sugar_g_mean'] if 'sugar_g_mean' in kpi else 0
+    avg_cal = kpi['calories_mean'] if 'calories_mean' in kpi else 0
+    max_caffeine = kpi['caffeine_mg_max'] if 'caffeine_mg_max' in kpi else 0
+    total_items = int(kpi['rows'])
 
     # FDA Daily Limit Context (Assuming ~50g sugar/day for reference)
     sugar_delta = f"{avg_sugar/50*100:.0f}% of Daily Limit"
@@ -109,13 +123,16 @@ else:
 st.divider()
 
 # --- SECTION B: VISUAL ANALYSIS (WITH EXPLANATION) ---
+section("home/sugar_trap")
 st.subheader("2. The 'Sugar-Energy' Trap")
 st.markdown("Analyze whether higher sugar content necessarily leads to higher calories.")
 
 col_viz, col_explain = st.columns([3, 1.2])
 
 with col_viz:
-    if not df_filtered.empty and 'calories' in df_filtered.columns and 'sugar_g' in df_filtered.columns:
+    if large_feed:
+        st.info("Row-level charts are turned off for large menu feeds. The KPIs above come from the streamed aggregate cube.")
+    elif not df_filtered.empty and 'calories' in df_filtered.columns and 'sugar_g' in df_filtered.columns:
         # Dynamic Tooltips
         tooltips = ['beverage', 'calories', 'sugar_g', 'category']
         if 'caffeine_mg' in df_filtered.columns: tooltips.append('caffeine_mg')
@@ -156,6 +173,7 @@ with col_explain:
     """)
 
 # --- SECTION C: ACTIONABLE LISTS (RANKINGS) ---
+section("home/top_contenders")
 st.divider()
 st.subheader("3. Top Contenders")
 st.markdown("Identifies the outliers: The heaviest treats vs. the lightest options.")
@@ -163,14 +181,27 @@ st.markdown("Identifies the outliers: The heaviest treats vs. the lightest optio
 # Tabs for better UI organization
 tab_heavy, tab_light = st.tabs(["🔴 The 'Heavyweights'", "🟢 The 'Lightweights'"])
 
+RANKINGS = [('calories', False), ('sugar_g', False), ('calories', True), ('sugar_g', True)]
+
+# Cả 4 bảng xếp hạng tính chung một lượt argpartition, cache theo bộ lọc category
+@st.cache_data(show_spinner=False)
+def get_rankings(selected: tuple):
+    data = get_members().select(category=list(selected)) if selected and 'category' in df.columns else df
+    return top_k_multi(data, RANKINGS, k=5)
+
+rankings = None if large_feed else get_rankings(tuple(selected_cats))
+
 # --- HÀM ĐƯỢC SỬA ĐỂ CHỐNG LỖI MATPLOTLIB ---
-def show_top_table(data, sort_col, asc, color_highlight):
-    if sort_col in data.columns:
+def show_top_table(sort_col, asc, color_highlight):
+    if rankings is None:
+        st.info("Rankings are not available for large menu feeds.")
+    elif (sort_col, asc) in rankings:
+        data = rankings[(sort_col, asc)]
         cols = ['beverage', sort_col, 'category']
         # Add Prep if exists
         if 'prep' in data.columns: cols.insert(1, 'prep')
         
-        display_df = data.sort_values(sort_col, ascending=asc).head(5)[cols]
+        display_df = data[cols]
         
         # Thử tô màu, nếu lỗi (do thiếu matplotlib) thì hiện bảng thường
         try:
@@ -194,24 +225,25 @@ with tab_heavy:
     with c1:
         st.markdown("**Highest Calorie Options**")
         st.caption("Drinks that might replace a full meal.")
-        show_top_table(df_filtered, 'calories', False, 'Reds')
+        show_top_table('calories', False, 'Reds')
     with c2:
         st.markdown("**Highest Sugar Options**")
         st.caption("Drinks exceeding daily sugar recommendations.")
-        show_top_table(df_filtered, 'sugar_g', False, 'Oranges')
+        show_top_table('sugar_g', False, 'Oranges')
 
 with tab_light:
     c1, c2 = st.columns(2)
     with c1:
         st.markdown("**Lowest Calorie Options**")
         st.caption("Best for weight management.")
-        show_top_table(df_filtered, 'calories', True, 'Greens')
+        show_top_table('calories', True, 'Greens')
     with c2:
         st.markdown("**Lowest Sugar Options**")
         st.caption("Best for blood sugar control.")
-        show_top_table(df_filtered, 'sugar_g', True, 'Teals')
+        show_top_table('sugar_g', True, 'Teals')
 
 # --- 4. CALL TO ACTION (NAVIGATION) ---
+section("home/navigation")
 st.divider()
 st.markdown("### 🚀 Ready to explore further?")
 col_nav1, col_nav2, col_nav3 = st.columns(3)
@@ -221,4 +253,7 @@ with col_nav1:
 with col_nav2:
     st.info("**⚖️ Can't decide?**\n\nUse the **Compare Page** to fight two drinks head-to-head.")
 with col_nav3:
-    st.info("**🤖 Need AI help?**\n\nAsk our **Recommender System** to pick a drink for you.")
\ No newline at end of file
+    st.info("**🤖 Need AI help?**\n\nAsk our **Recommender System** to pick a drink for you.")
+
+end_rerun()
+dev_panel()